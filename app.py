@@ -16,6 +16,7 @@ from routes.paciente import paciente_bp
 
 # Conexión a la base de datos
 from database.connection import close_db 
+from database import instrumentation
 
 # 1. Configuración de la aplicación
 app = Flask(__name__)
@@ -34,6 +35,7 @@ app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER') or app.conf
 # Inicialización de extensiones
 mail = Mail(app)
 serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+instrumentation.init_app(app) # Tiempos SQL por solicitud (Server-Timing y consultas lentas)
 
 # 2. Registro de Blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
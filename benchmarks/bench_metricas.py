@@ -0,0 +1,93 @@
+"""
+Compara el cálculo de métricas de reportes sobre una base SQLite de benchmark:
+
+- legado:   las tres consultas con f-string de la versión original (totales, sexo, edad)
+- directo:  una sola consulta parametrizada con agregación condicional (SUM(CASE ...)) por sexo
+            y rango de edad, en SQL (utils/metricas.py)
+- resumen:  lectura de la tabla pre-agregada resumen_campana
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.seed_sqlite --pacientes 1000000 --ruta instance/bench_1m.sqlite3 --reset
+    python -m benchmarks.bench_metricas --ruta instance/bench_1m.sqlite3 --repeticiones 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+
+def _metricas_legado(execute_query, campana_id):
+    """Réplica de las consultas originales de calcular_metricas_reporte (solo para comparar)."""
+    where_qr = ""
+    where_vinculados = "WHERE paciente_id IS NOT NULL"
+    where_paciente = "WHERE p.resultado IS NOT NULL"
+    if campana_id:
+        where_qr = f"WHERE numero_campana = '{campana_id}'"
+        where_vinculados = f"WHERE numero_campana = '{campana_id}' AND paciente_id IS NOT NULL"
+        where_paciente = f"""
+            WHERE p.resultado IS NOT NULL
+            AND p.id IN (SELECT paciente_id FROM qr WHERE numero_campana = '{campana_id}' AND paciente_id IS NOT NULL)
+        """
+    execute_query(f"""
+        SELECT (SELECT COUNT(id) FROM qr {where_qr}) as codigos_generados,
+               (SELECT COUNT(id) FROM qr {where_vinculados}) as codigos_vinculados,
+               SUM(CASE WHEN p.resultado = 'Positivo' THEN 1 ELSE 0 END) as positivos,
+               SUM(CASE WHEN p.resultado = 'Negativo' THEN 1 ELSE 0 END) as negativos,
+               COUNT(p.id) as total_evaluaciones
+        FROM paciente p {where_paciente}
+    """, fetch_one=True)
+    execute_query(f"SELECT UPPER(p.sexo) as sexo, COUNT(p.id) as total_sexo FROM paciente p {where_paciente} GROUP BY p.sexo")
+    execute_query(f"""
+        SELECT CASE WHEN p.edad BETWEEN 0 AND 5 THEN 1 WHEN p.edad BETWEEN 6 AND 10 THEN 2
+                    WHEN p.edad BETWEEN 11 AND 17 THEN 3 WHEN p.edad BETWEEN 18 AND 24 THEN 4
+                    WHEN p.edad BETWEEN 25 AND 34 THEN 5 WHEN p.edad BETWEEN 35 AND 44 THEN 6
+                    WHEN p.edad BETWEEN 45 AND 54 THEN 7 WHEN p.edad >= 55 THEN 8 ELSE 9 END as rango_orden,
+               COUNT(p.id) as total
+        FROM paciente p {where_paciente} AND p.edad IS NOT NULL
+        GROUP BY rango_orden ORDER BY rango_orden
+    """)
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), max(tiempos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del cálculo de métricas de reportes")
+    parser.add_argument('--ruta', default=os.path.join('instance', 'bench.sqlite3'))
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--campana', default='1', help="Campaña para la variante filtrada")
+    args = parser.parse_args(argv)
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = os.path.abspath(args.ruta)
+
+    from app import app
+    from database.connection import execute_query
+    from utils.metricas import calcular_resumen_directo, leer_resumen
+
+    with app.test_request_context():
+        pacientes = execute_query("SELECT COUNT(id) AS total FROM paciente", fetch_one=True)['total']
+        print(f"Pacientes: {pacientes}")
+        print(f"{'Variante':28} {'mediana ms':>11} {'máx ms':>9}")
+        for filtro in (None, args.campana):
+            etiqueta = f"campaña {filtro}" if filtro else "todas"
+            variantes = [
+                ('legado (3 consultas)', lambda: _metricas_legado(execute_query, filtro)),
+                ('directo (1 pasada)', lambda: calcular_resumen_directo(filtro)),
+                ('resumen_campana', lambda: leer_resumen(filtro)),
+            ]
+            for nombre, funcion in variantes:
+                mediana, maximo = _medir(funcion, args.repeticiones)
+                print(f"{nombre + ' / ' + etiqueta:28} {mediana:11.1f} {maximo:9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
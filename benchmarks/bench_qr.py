@@ -0,0 +1,77 @@
+"""
+Mide la generación de un lote de QRs (POST /doctor/generar_qr) contra una base SQLite local:
+tiempo total y tamaño del archivo entregado, comparados con el presupuesto QR_LOTE_PRESUPUESTO_S.
+Con --memoria también mide el pico de memoria de Python (tracemalloc; hace todo varias veces más lento).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.seed_sqlite --pacientes 1000 --ruta instance/bench_qr.sqlite3 --reset
+    python -m benchmarks.bench_qr --ruta instance/bench_qr.sqlite3 --cantidad 1000
+
+La columna ms/QR es la que debe usarse para QR_MS_POR_CODIGO en el host (config.py).
+Devuelve código de salida 1 si algún lote excede su presupuesto proporcional o QR_LOTE_MAXIMO.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de generación de lotes de QR")
+    parser.add_argument('--ruta', default=os.path.join('instance', 'bench_qr.sqlite3'))
+    parser.add_argument('--cantidad', type=int, action='append', help="Tamaño del lote (se puede repetir)")
+    parser.add_argument('--memoria', action='store_true', help="Medir el pico de memoria con tracemalloc")
+    args = parser.parse_args(argv)
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = os.path.abspath(args.ruta)
+
+    from app import app
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = 1
+        sesion['role'] = 1
+        sesion['full_name'] = 'doctor@bench.local'
+
+    presupuesto_maximo = app.config['QR_LOTE_PRESUPUESTO_S']
+    lote_maximo = app.config['QR_LOTE_MAXIMO']
+    excedido = False
+
+    print(f"{'QRs':>7} {'segundos':>9} {'presupuesto':>12} {'ms/QR':>7} {'MB archivo':>11} {'MB pico Python':>15}")
+    for cantidad in args.cantidad or [100, 1000]:
+        if cantidad > lote_maximo:
+            print(f"{cantidad:>7} excede QR_LOTE_MAXIMO ({lote_maximo})")
+            excedido = True
+            continue
+        if args.memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/doctor/generar_qr', data={
+            'campaign_number': f"bench-{int(time.time())}-{cantidad}",
+            'delivery_date': time.strftime('%Y-%m-%d'),
+            'quantity': str(cantidad),
+            'estado': '1', 'municipio': '1', 'colonia': '1', 'codigo_postal': '00000',
+        }, buffered=False)
+        tamano = sum(len(bloque) for bloque in respuesta.response) # Sin juntar el archivo en memoria
+        duracion = time.perf_counter() - inicio
+        pico = 0
+        if args.memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        if respuesta.status_code != 200:
+            print(f"{cantidad:>7} HTTP {respuesta.status_code}")
+            excedido = True
+            continue
+
+        presupuesto = presupuesto_maximo * cantidad / lote_maximo
+        excedido |= duracion > presupuesto
+        print(f"{cantidad:>7} {duracion:9.1f} {presupuesto:12.1f} {duracion / cantidad * 1000:7.1f} "
+              f"{tamano / 1e6:11.1f} {(f'{pico / 1e6:.1f}' if args.memoria else '-'):>15}")
+    return 1 if excedido else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Mide la latencia de las rutas principales contra una base SQLite local (ver seed_sqlite.py).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_rutas --ruta instance/bench.sqlite3 --repeticiones 20
+
+Para cada ruta reporta p50/p95 del tiempo total y el número de consultas y el tiempo
+en la DB informados por el encabezado Server-Timing.
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+# (rol, URL)
+RUTAS = [
+    (1, '/doctor/dashboard'),
+    (1, '/doctor/reportes'),
+    (1, '/doctor/reportes?campana_id=1'),
+    (1, '/doctor/api/comparar_campanas?campanas=1,2,3,4,5,6,7,8,9,10'),
+    (2, '/enfermero/dashboard'),
+    (2, '/enfermero/pacientes'),
+]
+
+_SERVER_TIMING_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rutas sobre SQLite")
+    parser.add_argument('--ruta', default=os.path.join('instance', 'bench.sqlite3'))
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--url', action='append', help="URL adicional a medir como doctor (se puede repetir)")
+    args = parser.parse_args(argv)
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = os.path.abspath(args.ruta)
+
+    from app import app
+
+    rutas = RUTAS + [(1, url) for url in (args.url or [])]
+    clientes = {}
+    for rol, usuario in ((1, 'doctor@bench.local'), (2, 'enfermero@bench.local')):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = rol
+            sesion['role'] = rol
+            sesion['full_name'] = usuario
+        clientes[rol] = cliente
+
+    print(f"{'Ruta':45} {'p50 ms':>9} {'p95 ms':>9} {'consultas':>10} {'DB ms':>9}")
+    for rol, url in rutas:
+        tiempos, db_ms, consultas = [], [], 0
+        for _ in range(args.repeticiones):
+            inicio = time.perf_counter()
+            respuesta = clientes[rol].get(url)
+            respuesta.get_data() # Consumir también las respuestas en streaming
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            coincidencia = _SERVER_TIMING_RE.search(respuesta.headers.get('Server-Timing', ''))
+            if coincidencia:
+                db_ms.append(float(coincidencia.group(1)))
+                consultas = int(coincidencia.group(2))
+            if respuesta.status_code >= 400:
+                print(f"  {url}: HTTP {respuesta.status_code}")
+                break
+
+        print(f"{url:45} {_percentil(tiempos, 50):9.1f} {_percentil(tiempos, 95):9.1f} "
+              f"{consultas:>10} {statistics.median(db_ms) if db_ms else 0:9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Crea y llena una base SQLite local con un volumen de datos realista para benchmarks.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.seed_sqlite --pacientes 100000 --ruta instance/bench.sqlite3 --reset
+
+Usuarios de prueba: doctor@bench.local / enfermero@bench.local (contraseña: bench).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Genera datos de benchmark en SQLite")
+    parser.add_argument('--ruta', default=os.path.join('instance', 'bench.sqlite3'), help="Archivo SQLite destino")
+    parser.add_argument('--pacientes', type=int, default=100000)
+    parser.add_argument('--campanas', type=int, default=20)
+    parser.add_argument('--qrs-libres', type=float, default=0.25, help="QRs sin vincular, como fracción de los pacientes")
+    parser.add_argument('--con-resultado', type=float, default=0.85, help="Fracción de pacientes que capturaron resultado")
+    parser.add_argument('--positividad', type=float, default=0.02)
+    parser.add_argument('--colonias', type=int, default=5000)
+    parser.add_argument('--semilla', type=int, default=2025)
+    parser.add_argument('--reset', action='store_true', help="Borra el archivo antes de generar")
+    return parser.parse_args(argv)
+
+
+def _lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    ruta = os.path.abspath(args.ruta)
+
+    if args.reset:
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(ruta + sufijo):
+                os.remove(ruta + sufijo)
+
+    # El backend se elige antes de importar la aplicación
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = ruta
+
+    from app import app
+    from database.connection import execute_many
+    from database import migrations
+    from utils.metricas import reconstruir_resumen
+
+    rnd = random.Random(args.semilla)
+    inicio = time.perf_counter()
+
+    with app.app_context():
+        migrations.upgrade()
+
+        # --- Catálogos de ubicación ---
+        estados = [(i, f"Estado {i}") for i in range(1, 33)]
+        municipios = [(i, f"Municipio {i}", rnd.randint(1, 32)) for i in range(1, max(2, args.colonias // 15) + 1)]
+        colonias = [
+            (i, f"Colonia {i}", f"{rnd.randint(10000, 99999)}", rnd.randint(1, len(municipios)))
+            for i in range(1, args.colonias + 1)
+        ]
+        municipio_estado = {m[0]: m[2] for m in municipios}
+        execute_many("INSERT INTO estados (id, nombre) VALUES (%s, %s)", estados)
+        execute_many("INSERT INTO municipios (id, nombre, estado) VALUES (%s, %s, %s)", municipios)
+        execute_many("INSERT INTO colonias (id, nombre, codigo_postal, municipio) VALUES (%s, %s, %s, %s)", colonias)
+
+        # --- Usuarios de prueba ---
+        execute_many(
+            "INSERT INTO usuario (id, usuario, password, rol_id) VALUES (%s, %s, %s, %s)",
+            [(1, 'doctor@bench.local', 'bench', 1), (2, 'enfermero@bench.local', 'bench', 2)]
+        )
+        execute_many(
+            "INSERT INTO personal (nombre, email, usuario_id) VALUES (%s, %s, %s)",
+            [('Doctor Bench', 'doctor@bench.local', 1), ('Enfermero Bench', 'enfermero@bench.local', 2)]
+        )
+
+        # --- Pacientes y QRs ---
+        hoy = datetime.now().replace(microsecond=0)
+        campanas = [str(c) for c in range(1, args.campanas + 1)]
+
+        def ubicacion():
+            colonia = colonias[rnd.randrange(len(colonias))]
+            return municipio_estado[colonia[3]], colonia[3], colonia[0], colonia[2]
+
+        def filas_paciente():
+            for paciente_id in range(1, args.pacientes + 1):
+                id_estado, id_municipio, id_colonia, cp = ubicacion()
+                resultado = None
+                if rnd.random() < args.con_resultado:
+                    resultado = 'Positivo' if rnd.random() < args.positividad else 'Negativo'
+                yield (
+                    paciente_id, f"Nombre{paciente_id}", f"Apellido{paciente_id % 997}", None,
+                    rnd.choices(['Masculino', 'Femenino', 'Otro'], weights=[48, 50, 2])[0],
+                    int(rnd.triangular(14, 75, 27)), None, None,
+                    id_estado, id_municipio, id_colonia, cp, resultado,
+                    hoy - timedelta(minutes=rnd.randint(0, 365 * 24 * 60)),
+                )
+
+        def filas_qr():
+            total_libres = int(args.pacientes * args.qrs_libres)
+            for i in range(1, args.pacientes + total_libres + 1):
+                id_estado, id_municipio, id_colonia, cp = ubicacion()
+                vinculado = i <= args.pacientes
+                yield (
+                    str(uuid.UUID(int=rnd.getrandbits(128))), rnd.choice(campanas),
+                    (hoy - timedelta(days=rnd.randint(0, 365))).date(),
+                    'Vinculado' if vinculado else 'Generado',
+                    id_estado, id_municipio, id_colonia, cp,
+                    i if vinculado else None,
+                )
+
+        query_paciente = """
+        INSERT INTO paciente (id, nombre, apellido_paterno, apellido_materno, sexo, edad, telefono, ocupacion,
+                              id_estado, id_municipio, id_colonia, codigo_postal, resultado, fecha_registro)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        query_qr = """
+        INSERT INTO qr (codigo, numero_campana, fecha_entrega, estado, id_estado, id_municipio, id_colonia, codigo_postal, paciente_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        for lote in _lotes(filas_paciente(), 20000):
+            execute_many(query_paciente, lote, chunk_size=20000)
+        for lote in _lotes(filas_qr(), 20000):
+            execute_many(query_qr, lote, chunk_size=20000)
+
+        # Los datos se cargaron sin pasar por las rutas: recalcular el resumen por campaña
+        reconstruir_resumen()
+
+    print(f"Base de benchmark lista en {ruta} ({args.pacientes} pacientes) en {time.perf_counter() - inicio:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
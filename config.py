@@ -3,6 +3,9 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'una_clave_de_respaldo_segura'
     
+    # Backend de base de datos: 'mysql' (producción) o 'sqlite' (archivo local para benchmarks/pruebas)
+    DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'autopruebas_vih.sqlite3')
    
     MYSQL_HOST = 'localhost'        
     MYSQL_USER = 'root'
@@ -10,6 +13,59 @@ class Config:
     MYSQL_DB = 'autopruebas_vih'   
     MYSQL_PORT = 3306
 
+    # Pool de conexiones (por proceso/worker)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))     # Segundos de espera si el pool está agotado
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))    # Segundos de vida máxima de una conexión
+    DB_PREPARED_CACHE_SIZE = int(os.environ.get('DB_PREPARED_CACHE_SIZE', 32))  # Sentencias preparadas por conexión
+    DB_FETCH_SIZE = int(os.environ.get('DB_FETCH_SIZE', 500))        # Filas por bloque en iter_query
+
+    # Réplica de lectura (opcional, solo MySQL): los SELECT van a la réplica; las escrituras a la primaria
+    DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')              # None = sin réplica
+    DB_REPLICA_PORT = int(os.environ.get('DB_REPLICA_PORT', 3306))
+    DB_REPLICA_USER = os.environ.get('DB_REPLICA_USER')              # Por defecto, el de la primaria
+    DB_REPLICA_PASSWORD = os.environ.get('DB_REPLICA_PASSWORD')
+    DB_REPLICA_POOL_SIZE = int(os.environ.get('DB_REPLICA_POOL_SIZE', 10))
+    DB_REPLICA_TIMEOUT = float(os.environ.get('DB_REPLICA_TIMEOUT', 1))   # Espera máxima antes de caer a la primaria
+    DB_REPLICA_RETRY = int(os.environ.get('DB_REPLICA_RETRY', 30))        # Segundos sin usar la réplica tras un fallo
+
+    # Instrumentación SQL
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))      # Umbral del log de consultas lentas
+    SQL_SERVER_TIMING = os.environ.get('SQL_SERVER_TIMING', 'True') == 'True'
+
+    # Cache de KPIs de los dashboards (segundos; 0 lo desactiva)
+    KPI_CACHE_TTL = float(os.environ.get('KPI_CACHE_TTL', 5))
+    # Cache de reportes: edad (segundos) a partir de la cual se recalcula en segundo plano
+    REPORT_CACHE_MAX_AGE = float(os.environ.get('REPORT_CACHE_MAX_AGE', 60))
+
+    # Timeout del worker del servidor WSGI (gunicorn --timeout; 30 s por omisión): debe coincidir con el despliegue
+    WORKER_TIMEOUT_S = float(os.environ.get('WORKER_TIMEOUT_S', 30))
+
+    # Generación de QRs por lote: hasta QR_LOTE_PDF_MAXIMO se entrega un solo PDF; los lotes mayores
+    # (hasta QR_LOTE_MAXIMO) se entregan como ZIP de PDFs de QR_LOTE_POR_PDF códigos cada uno.
+    # El lote se genera dentro de la solicitud (no hay cola de trabajos), así que QR_LOTE_MAXIMO se limita a lo
+    # que cabe en QR_LOTE_PRESUPUESTO_S (80% de WORKER_TIMEOUT_S) a QR_MS_POR_CODIGO por código; ese costo
+    # (inserción, matriz, PDF y ZIP) es un supuesto: medirlo en el host con benchmarks/bench_qr (~17 ms en 1 CPU)
+    QR_LOTE_PDF_MAXIMO = int(os.environ.get('QR_LOTE_PDF_MAXIMO', 100))
+    QR_LOTE_PRESUPUESTO_S = float(os.environ.get('QR_LOTE_PRESUPUESTO_S', WORKER_TIMEOUT_S * 0.8)) # Tiempo máximo (lote de QR_LOTE_MAXIMO)
+    QR_MS_POR_CODIGO = float(os.environ.get('QR_MS_POR_CODIGO', 20))
+    QR_LOTE_MAXIMO = max(1, min(int(os.environ.get('QR_LOTE_MAXIMO', 10000)),
+                                int(min(QR_LOTE_PRESUPUESTO_S, WORKER_TIMEOUT_S * 0.8) * 1000 / QR_MS_POR_CODIGO)))
+    QR_LOTE_POR_PDF = int(os.environ.get('QR_LOTE_POR_PDF', 500))
+    QR_LOTE_BLOQUE_INSERT = int(os.environ.get('QR_LOTE_BLOQUE_INSERT', 1000))      # Filas por INSERT multi-fila
+    QR_LOTE_SPOOL_BYTES = int(os.environ.get('QR_LOTE_SPOOL_BYTES', 16 * 1024 * 1024)) # Más de esto va a disco
+
+    # Cálculo de las matrices QR de un lote en un pool de procesos (1 lo desactiva). El pool es POR WORKER:
+    # con N workers de gunicorn el host puede tener N × QR_PROCESOS procesos de QR más los propios workers,
+    # así que se usa un valor fijo pequeño y no uno por CPU. Subirlo solo si N × QR_PROCESOS cabe en las CPUs.
+    QR_PROCESOS = int(os.environ.get('QR_PROCESOS', 2))
+    QR_PARALELO_MINIMO = int(os.environ.get('QR_PARALELO_MINIMO', 24)) # Lotes menores se calculan en el proceso
+
+    QR_PENDIENTES_POR_PAGINA = int(os.environ.get('QR_PENDIENTES_POR_PAGINA', 60)) # Galería de enfermero.vincular_inicio
+
+    # Cache LRU de QRs renderizados (matrices e imágenes), compartido por todos los blueprints; 0 lo desactiva
+    QR_CACHE_ENTRADAS = int(os.environ.get('QR_CACHE_ENTRADAS', 2048))
+
     QR_PDF_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static/qrs_pdf')
     if not os.path.exists(QR_PDF_FOLDER):
         os.makedirs(QR_PDF_FOLDER)
\ No newline at end of file
@@ -0,0 +1,273 @@
+"""
+Backends de base de datos intercambiables para database/connection.py.
+
+- 'mysql'  (por defecto): mysql.connector contra Config.MYSQL_*.
+- 'sqlite': archivo SQLite local (Config.SQLITE_PATH), para benchmarks y pruebas sin servidor MySQL.
+  Traduce los marcadores %s, el DDL de las migraciones y emula las funciones exclusivas de MySQL
+  que usa la aplicación (DATE_FORMAT, CONCAT, NOW).
+
+Se elige con Config.DB_BACKEND (variable de entorno DB_BACKEND).
+"""
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+
+import mysql.connector
+from mysql.connector import errorcode
+
+# Errores de cualquier backend (usar en los `except` de la capa de datos)
+DatabaseError = (mysql.connector.Error, sqlite3.Error)
+
+
+def is_already_exists_error(err):
+    """Indica si el error corresponde a una tabla o índice que ya existe (migraciones idempotentes)."""
+    if isinstance(err, mysql.connector.Error):
+        return err.errno in (errorcode.ER_DUP_KEYNAME, errorcode.ER_TABLE_EXISTS_ERROR)
+    return isinstance(err, sqlite3.OperationalError) and 'already exists' in str(err)
+
+
+def is_duplicate_entry_error(err):
+    """
+    Indica si el error es una fila duplicada. En MySQL, con raise_on_warnings, INSERT IGNORE sobre
+    filas existentes emite la advertencia 1062 y el conector la lanza como excepción (SQLite no lo hace).
+    """
+    return isinstance(err, mysql.connector.Error) and err.errno == errorcode.ER_DUP_ENTRY
+
+
+# --- MYSQL ---
+
+class MySQLBackend:
+    name = 'mysql'
+
+    def __init__(self, config, replica=False):
+        self.connect_args = {
+            'host': config['MYSQL_HOST'],
+            'user': config['MYSQL_USER'],
+            'password': config['MYSQL_PASSWORD'],
+            'database': config['MYSQL_DB'],
+            'port': config['MYSQL_PORT'],
+            'raise_on_warnings': True, # Útil para depuración
+        }
+        if replica:
+            # La réplica hereda de la primaria lo que no se configure explícitamente
+            self.connect_args.update({
+                'host': config['DB_REPLICA_HOST'],
+                'port': config.get('DB_REPLICA_PORT') or config['MYSQL_PORT'],
+                'user': config.get('DB_REPLICA_USER') or config['MYSQL_USER'],
+                'password': config.get('DB_REPLICA_PASSWORD') or config['MYSQL_PASSWORD'],
+            })
+
+    def connect(self):
+        return mysql.connector.connect(**self.connect_args)
+
+
+# --- SQLITE ---
+
+# Especificadores de DATE_FORMAT (MySQL) -> strftime (Python)
+_MYSQL_DATE_FORMAT = {
+    '%Y': '%Y', '%y': '%y', '%m': '%m', '%c': '%-m', '%d': '%d', '%e': '%-d',
+    '%H': '%H', '%k': '%-H', '%i': '%M', '%s': '%S', '%S': '%S', '%p': '%p',
+    '%M': '%B', '%b': '%b', '%W': '%A', '%a': '%a', '%j': '%j', '%%': '%%',
+}
+
+# Reescrituras del dialecto MySQL al de SQLite (principalmente DDL de las migraciones)
+_SQLITE_REWRITES = [
+    (re.compile(r'\)\s*ENGINE\s*=\s*\w+(\s+DEFAULT\s+CHARSET\s*=\s*\w+)?', re.I), ')'),
+    (re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.I), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bDROP\s+INDEX\s+(\w+)\s+ON\s+\w+', re.I), r'DROP INDEX \1'), # SQLite no lleva la tabla
+]
+
+_PARAM_RE = re.compile(r'%s|%%')
+
+
+def _parse_fecha(valor):
+    if valor is None or isinstance(valor, (date, datetime)):
+        return valor
+    texto = str(valor)
+    try:
+        return datetime.fromisoformat(texto) # Formato con el que se guardan (camino rápido)
+    except ValueError:
+        pass
+    for formato in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return None
+
+
+def _sqlite_date_format(valor, formato):
+    fecha = _parse_fecha(valor)
+    if fecha is None or formato is None:
+        return None
+    formato_py = re.sub(r'%.', lambda m: _MYSQL_DATE_FORMAT.get(m.group(0), m.group(0)), formato)
+    return fecha.strftime(formato_py)
+
+
+def _sqlite_concat(*args):
+    # Igual que en MySQL: CONCAT con algún NULL devuelve NULL
+    if any(a is None for a in args):
+        return None
+    return ''.join(str(a) for a in args)
+
+
+def _sqlite_now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _convertir_fecha(valor):
+    fecha = _parse_fecha(valor.decode())
+    return fecha.date() if fecha is not None else valor.decode()
+
+
+def _convertir_fecha_hora(valor):
+    fecha = _parse_fecha(valor.decode())
+    return fecha if fecha is not None else valor.decode()
+
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(sep=' '))
+sqlite3.register_converter('DATE', _convertir_fecha)
+sqlite3.register_converter('DATETIME', _convertir_fecha_hora)
+
+
+def translate_sqlite(query, has_params):
+    """Traduce una sentencia escrita para MySQL al dialecto de SQLite."""
+    for patron, reemplazo in _SQLITE_REWRITES:
+        query = patron.sub(reemplazo, query)
+    if has_params:
+        # Igual que mysql.connector: con parámetros, %s es el marcador y %% un % literal
+        query = _PARAM_RE.sub(lambda m: '?' if m.group(0) == '%s' else '%', query)
+    return query
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz mínima de mysql.connector que usa la capa de datos."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+        self._fetched = 0
+
+    def execute(self, query, params=()):
+        params = tuple(params or ())
+        self._fetched = 0
+        self._cursor.execute(translate_sqlite(query, bool(params)), params)
+
+    def executemany(self, query, seq_params):
+        self._fetched = 0
+        self._cursor.executemany(translate_sqlite(query, True), [tuple(p) for p in seq_params])
+
+    def _fila(self, fila):
+        if fila is None or not self._dictionary:
+            return fila
+        return dict(zip((d[0] for d in self._cursor.description), fila))
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        if fila is not None:
+            self._fetched += 1
+        return self._fila(fila)
+
+    def fetchmany(self, size=1):
+        filas = self._cursor.fetchmany(size)
+        self._fetched += len(filas)
+        return [self._fila(f) for f in filas]
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        self._fetched += len(filas)
+        return [self._fila(f) for f in filas]
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        # En SELECT, SQLite devuelve -1: se informa el número de filas leídas (como MySQL)
+        return self._cursor.rowcount if self._cursor.rowcount >= 0 else self._fetched
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Conexión SQLite con la interfaz mínima de mysql.connector que usa la capa de datos."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, dictionary=False, buffered=None, prepared=False):
+        # SQLite ya cachea las sentencias compiladas por conexión (cached_statements):
+        # `prepared` y `buffered` no requieren tratamiento especial.
+        return SQLiteCursor(self._raw.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def is_connected(self):
+        try:
+            self._raw.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._raw.close()
+
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, config):
+        self.path = config['SQLITE_PATH']
+
+    def connect(self):
+        carpeta = os.path.dirname(self.path)
+        if carpeta and not os.path.exists(carpeta):
+            os.makedirs(carpeta)
+
+        raw = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False, # El pool entrega la conexión a un hilo a la vez
+            timeout=30,
+            cached_statements=256,
+        )
+        raw.execute('PRAGMA journal_mode=WAL')
+        raw.execute('PRAGMA synchronous=NORMAL')
+        raw.execute('PRAGMA foreign_keys=ON')
+        raw.create_function('DATE_FORMAT', 2, _sqlite_date_format, deterministic=True)
+        raw.create_function('CONCAT', -1, _sqlite_concat, deterministic=True)
+        raw.create_function('NOW', 0, _sqlite_now)
+        return SQLiteConnection(raw)
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def create_backend(config, replica=False):
+    """Crea el backend indicado por Config.DB_BACKEND (`replica=True` para la réplica de lectura, solo MySQL)."""
+    nombre = (config.get('DB_BACKEND') or 'mysql').lower()
+    if nombre not in BACKENDS:
+        raise ValueError(f"DB_BACKEND no soportado: '{nombre}'. Opciones: {', '.join(BACKENDS)}")
+    if replica:
+        return MySQLBackend(config, replica=True)
+    return BACKENDS[nombre](config)
@@ -1,55 +1,417 @@
-import mysql.connector
-from flask import current_app, g
-from functools import wraps 
+from mysql.connector import errors as mysql_errors
+from flask import current_app, g, has_app_context
+from database.backends import create_backend, DatabaseError
+from database.instrumentation import record_query
+from functools import wraps, lru_cache 
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+from itertools import islice
+import threading
+import time
 
 db_pool = None 
+replica_pool = None
+_db_pool_lock = threading.Lock()
+_replica_down_until = 0.0 # Momento (monotonic) hasta el que la réplica se considera caída
+
+
+# --- POOL DE CONEXIONES ---
+
+class _PooledConnection:
+    """Envoltura de una conexión física del pool con sus marcas de tiempo."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.statements = OrderedDict() # Cache LRU de sentencias preparadas: SQL -> (SQL, cursor)
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones por proceso (worker), sobre el backend configurado (MySQL o SQLite).
+    - Tamaño máximo configurable (DB_POOL_SIZE).
+    - Verificación y reinicio de la conexión al prestarla (ROLLBACK).
+    - Reciclaje de conexiones más antiguas que DB_POOL_RECYCLE segundos.
+    - Espera con límite de tiempo (DB_POOL_TIMEOUT) cuando el pool está agotado.
+    """
+
+    def __init__(self, backend, size=10, timeout=5.0, recycle=1800):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._idle = deque()
+        self._total = 0      # Conexiones físicas abiertas (ociosas + prestadas)
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        # Estadísticas acumuladas
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = self.backend.connect()
+        with self._cond:
+            self._created += 1
+        return _PooledConnection(conn)
+
+    def _close_quietly(self, entry):
+        try:
+            entry.conn.close()
+        except DatabaseError:
+            pass
+
+    def _validate(self, entry):
+        """Recicla la conexión si es antigua; si no, la verifica con un ROLLBACK.
+
+        El ROLLBACK sirve de ping y además descarta cualquier transacción o
+        snapshot que haya quedado abierto del préstamo anterior.
+        """
+        if self.recycle and time.monotonic() - entry.created_at > self.recycle:
+            self._close_quietly(entry)
+            with self._cond:
+                self._recycled += 1
+            return self._connect()
+
+        try:
+            entry.conn.rollback()
+            return entry
+        except DatabaseError:
+            self._close_quietly(entry)
+            with self._cond:
+                self._discarded += 1
+            return self._connect()
+
+    def acquire(self):
+        """Presta una conexión; espera hasta `timeout` segundos si el pool está agotado."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        entry = None
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop() # LIFO: reutiliza las conexiones más calientes
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise mysql_errors.PoolError(
+                        f"Pool de conexiones agotado ({self.size} en uso) tras esperar {self.timeout}s."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._checkouts += 1
+            wait_time = time.monotonic() - start
+            if waited:
+                self._waits += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        try:
+            entry = self._validate(entry) if entry is not None else self._connect()
+        except Exception:
+            # No se pudo abrir la conexión: liberar el lugar reservado
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        entry.last_used = time.monotonic()
+        return entry
+
+    def release(self, entry, discard=False):
+        """Devuelve una conexión al pool (o la cierra si `discard=True` o ya pasó su edad de reciclaje).
+
+        No se hace ping aquí: sería un viaje de ida y vuelta por préstamo. Las conexiones caídas
+        se detectan al prestarlas (_validate) o las marca quien las usó (discard=True).
+        """
+        recycle = not discard and self.recycle and time.monotonic() - entry.created_at > self.recycle
+        if discard or recycle:
+            self._close_quietly(entry)
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or recycle:
+                self._total -= 1
+                if recycle:
+                    self._recycled += 1
+                else:
+                    self._discarded += 1
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def stats(self):
+        """Devuelve las estadísticas actuales del pool (para dimensionarlo por worker)."""
+        with self._cond:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'total': self._total,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_avg_ms': round(self._wait_time_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'created': self._created,
+                'recycled': self._recycled,
+                'discarded': self._discarded,
+            }
+
+
+def get_pool():
+    """Devuelve el pool del proceso actual, creándolo la primera vez con la configuración de la app."""
+    global db_pool
+    if db_pool is None:
+        with _db_pool_lock:
+            if db_pool is None:
+                config = current_app.config
+                db_pool = ConnectionPool(
+                    backend=create_backend(config),
+                    size=config.get('DB_POOL_SIZE', 10),
+                    timeout=config.get('DB_POOL_TIMEOUT', 5.0),
+                    recycle=config.get('DB_POOL_RECYCLE', 1800),
+                )
+    return db_pool
+
+
+def get_replica_pool():
+    """Pool de la réplica de lectura (None si DB_REPLICA_HOST no está configurado o el backend no la soporta)."""
+    global replica_pool
+    config = current_app.config
+    if not config.get('DB_REPLICA_HOST') or (config.get('DB_BACKEND') or 'mysql').lower() != 'mysql':
+        return None
+    if replica_pool is None:
+        with _db_pool_lock:
+            if replica_pool is None:
+                replica_pool = ConnectionPool(
+                    backend=create_backend(config, replica=True),
+                    size=config.get('DB_REPLICA_POOL_SIZE') or config.get('DB_POOL_SIZE', 10),
+                    timeout=config.get('DB_REPLICA_TIMEOUT', 1.0),
+                    recycle=config.get('DB_POOL_RECYCLE', 1800),
+                )
+    return replica_pool
+
+
+def _mark_replica_down(err):
+    """Deja de usar la réplica durante DB_REPLICA_RETRY segundos tras un fallo."""
+    global _replica_down_until
+    retry = current_app.config.get('DB_REPLICA_RETRY', 30)
+    _replica_down_until = time.monotonic() + retry
+    current_app.logger.warning(f"Réplica de lectura no disponible, se usa la primaria durante {retry}s: {err}")
+
+
+def _is_connection_error(err):
+    """Errores de conexión/servidor (no de la sentencia), que justifican pasar a la primaria."""
+    return isinstance(err, (mysql_errors.OperationalError, mysql_errors.InterfaceError))
+
+
+def _replica_available():
+    """La lectura puede ir a la réplica: está configurada, no está caída y la solicitud no ha escrito."""
+    return (
+        not _reads_on_primary()
+        and time.monotonic() >= _replica_down_until
+        and get_replica_pool() is not None
+    )
+
+
+def get_backend():
+    """Backend activo ('mysql' o 'sqlite' en `.name`), para sentencias que dependen del dialecto."""
+    return get_pool().backend
+
+
+def get_pool_stats():
+    """Estadísticas del pool del proceso (en uso, ociosas, tiempos de espera)."""
+    return db_pool.stats() if db_pool is not None else {}
+
+
+def get_replica_stats():
+    """Estadísticas del pool de la réplica ({} si no hay réplica en uso)."""
+    return replica_pool.stats() if replica_pool is not None else {}
+
 
 def get_db():
-    """Inicializa y devuelve una conexión directa (NO de Pool), utilizando las claves de Config."""
+    """Toma una conexión del pool para la solicitud actual (se devuelve en close_db)."""
     if 'db' not in g:
         try:
-            
-            g.db = mysql.connector.connect(
-                host=current_app.config['MYSQL_HOST'],
-                user=current_app.config['MYSQL_USER'],
-                password=current_app.config['MYSQL_PASSWORD'],
-                database=current_app.config['MYSQL_DB'],
-                port=current_app.config['MYSQL_PORT'], 
-                raise_on_warnings=True # Útil para depuración
-            )
-        except mysql.connector.Error as e:
+            g.db_entry = get_pool().acquire()
+            g.db = g.db_entry.conn
+        except DatabaseError as e:
             current_app.logger.error(f"Error al conectar a la base de datos: {e}")
             # Lanzamos la excepción para que Flask muestre el rastreo completo
             raise 
     return g.db
 
+def _get_read_entry():
+    """
+    Conexión (del pool) para lecturas de la solicitud actual.
+    Usa la réplica si está disponible; después de una escritura en la solicitud
+    (read-your-writes), dentro de `primary_reads()` o si la réplica falla, usa la primaria.
+    """
+    if 'db_replica_entry' in g and not _reads_on_primary():
+        return g.db_replica_entry
+    if _replica_available():
+        try:
+            g.db_replica_entry = replica_pool.acquire()
+            return g.db_replica_entry
+        except DatabaseError as err:
+            _mark_replica_down(err)
+    get_db()
+    return g.db_entry
+
+def _drop_replica_entry():
+    """Descarta la conexión de réplica de la solicitud (tras un fallo)."""
+    entry = g.pop('db_replica_entry', None)
+    if entry is not None:
+        replica_pool.release(entry, discard=True)
+
 def close_db(e=None):
-    """Cierra la conexión a la base de datos."""
-    db = g.pop('db', None)
-    if db is not None and db.is_connected():
-        db.close()
+    """Devuelve las conexiones de la solicitud (primaria y réplica) a sus pools."""
+    g.pop('db', None)
+    entry = g.pop('db_entry', None)
+    if entry is not None:
+        db_pool.release(entry)
+    replica_entry = g.pop('db_replica_entry', None)
+    if replica_entry is not None:
+        replica_pool.release(replica_entry)
+
+def _in_transaction():
+    """Indica si la solicitud actual está dentro de un bloque `transaction()`."""
+    return g.get('db_tx_depth', 0) > 0
 
-def execute_query(query, params=None, fetch_one=False, commit=False):
+def _reads_on_primary():
+    """Las lecturas de la solicitud deben ir a la primaria (transacción, escritura previa o primary_reads)."""
+    return _in_transaction() or g.get('db_wrote') or g.get('db_primary_depth', 0) > 0
+
+@contextmanager
+def primary_reads():
+    """
+    Las lecturas del bloque van a la primaria aunque haya réplica. Para los cargadores de cache:
+    se ejecutan después de una invalidación (en otra solicitud o en segundo plano, sin `db_wrote`)
+    y con retraso de la réplica guardarían como vigentes los datos anteriores a la escritura.
+    """
+    g.db_primary_depth = g.get('db_primary_depth', 0) + 1
+    try:
+        yield
+    finally:
+        g.db_primary_depth -= 1
+
+@contextmanager
+def transaction():
+    """
+    Unidad de trabajo para escrituras de varias sentencias.
+    - Todas las llamadas a execute_query/execute_many del bloque usan la misma conexión
+      y se confirman con UN solo COMMIT al salir (commit=True no confirma por sentencia).
+    - Si ocurre una excepción (incluido un error SQL), se revierte todo y se propaga.
+    - Los bloques anidados se unen a la transacción externa.
+    """
+    conn = get_db()
+    if _in_transaction():
+        g.db_tx_depth += 1
+        try:
+            yield conn
+        finally:
+            g.db_tx_depth -= 1
+        return
+
+    g.db_tx_depth = 1
+    g.db_wrote = True # El resto de la solicitud lee de la primaria (read-your-writes)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        g.db_tx_depth = 0
+
+@lru_cache(maxsize=1024)
+def _statement_kind(query):
+    """Tipo de sentencia ('SELECT', 'INSERT', 'UPDATE', ...), calculado una sola vez por texto SQL."""
+    stripped = query.lstrip()
+    return stripped.split(None, 1)[0].upper() if stripped else ''
+
+def _get_prepared_cursor(entry, query):
+    """
+    Devuelve (sql, cursor) con una sentencia preparada en el servidor para `query`.
+    El cache es por conexión física y desaloja la menos usada (LRU) al superar DB_PREPARED_CACHE_SIZE.
+    Se devuelve el mismo objeto `sql` guardado: el conector solo reutiliza la sentencia
+    preparada si recibe exactamente el mismo objeto de texto.
+    """
+    statements = entry.statements
+    cached = statements.get(query)
+    if cached is not None:
+        statements.move_to_end(query)
+        return cached
+
+    cached = (query, entry.conn.cursor(prepared=True, dictionary=True))
+    statements[query] = cached
+    if len(statements) > current_app.config.get('DB_PREPARED_CACHE_SIZE', 32):
+        _, (_, old_cursor) = statements.popitem(last=False)
+        _close_prepared_cursor(old_cursor)
+    return cached
+
+def _close_prepared_cursor(cursor):
+    """Cierra un cursor preparado (libera la sentencia en el servidor) sin propagar errores."""
+    try:
+        cursor.close()
+    except DatabaseError:
+        pass
+
+def execute_query(query, params=None, fetch_one=False, commit=False, prepared=False):
     """
     Ejecuta una consulta SQL.
     - Si commit=True y es INSERT, devuelve lastrowid (int).
     - Si commit=True y es UPDATE/DELETE, devuelve rowcount (int).
+    - Dentro de `transaction()` no confirma y los errores SQL se propagan para revertir el bloque.
+    - prepared=True (opcional) usa una sentencia preparada en el servidor, cacheada por conexión;
+      pensado para consultas calientes que se repiten con el mismo texto SQL.
+    - Los SELECT sin commit van a la réplica de lectura si está configurada (ver _get_read_entry).
     """
-    conn = get_db()
-    # Usamos cursor(dictionary=True) para que los resultados sean diccionarios (muy recomendado en Flask)
-    cursor = conn.cursor(dictionary=True) 
-    
-    # Normalizar la consulta a mayúsculas para la verificación
-    normalized_query = query.strip().upper()
+    kind = _statement_kind(query)
 
+    if commit or kind != 'SELECT':
+        get_db()
+        entry = g.db_entry
+        g.db_wrote = True
+    else:
+        entry = _get_read_entry()
+    conn = entry.conn
+    on_replica = entry is g.get('db_replica_entry')
+
+    if prepared:
+        query, cursor = _get_prepared_cursor(entry, query)
+    else:
+        # Usamos cursor(dictionary=True) para que los resultados sean diccionarios (muy recomendado en Flask)
+        cursor = conn.cursor(dictionary=True) 
+
+    start = time.perf_counter()
     try:
         cursor.execute(query, params or ())
         
         if commit:
-            conn.commit()
-            
+            if not _in_transaction():
+                conn.commit()
             
-            if normalized_query.startswith(('UPDATE', 'DELETE')):
+            if kind in ('UPDATE', 'DELETE'):
                 # Devuelve el número de filas afectadas (ej. 1 si fue exitoso)
                 return cursor.rowcount 
             
@@ -57,6 +419,10 @@ def execute_query(query, params=None, fetch_one=False, commit=False):
             return cursor.lastrowid 
         
         elif fetch_one:
+            if prepared:
+                # El cursor preparado se reutiliza: hay que consumir todo el resultado
+                rows = cursor.fetchall()
+                return rows[0] if rows else None
             return cursor.fetchone()
             
         elif cursor.description is not None:
@@ -65,13 +431,121 @@ def execute_query(query, params=None, fetch_one=False, commit=False):
         
         return None # Para queries que no esperan resultado
         
-    except mysql.connector.Error as err:
+    except DatabaseError as err:
         current_app.logger.error(f"Error SQL: {err} | Query: {query} | Params: {params}")
+        if prepared:
+            # No reutilizar un cursor preparado que quedó en estado de error
+            entry.statements.pop(query, None)
+            _close_prepared_cursor(cursor)
+        if on_replica and _is_connection_error(err):
+            # Réplica caída o inalcanzable: reintento único en la primaria
+            _mark_replica_down(err)
+            _drop_replica_entry()
+            return execute_query(query, params, fetch_one=fetch_one, commit=commit, prepared=prepared)
+        if _in_transaction():
+            raise # transaction() se encarga del rollback
         if commit:
             conn.rollback() 
         return 0 # Devuelve 0 para indicar que 0 filas fueron afectadas, indicando un fallo
     finally:
-        # Es fundamental cerrar el cursor después de cada ejecución
+        record_query(query, time.perf_counter() - start, cursor.rowcount)
+        # Es fundamental cerrar el cursor después de cada ejecución (los preparados se quedan en el cache)
+        if not prepared:
+            cursor.close()
+
+def iter_query(query, params=None, fetch_size=None):
+    """
+    Generador que recorre un SELECT grande con memoria constante (una fila a la vez, como diccionario).
+    - Usa un cursor sin buffer: el servidor envía las filas a medida que se leen, en bloques
+      de `fetch_size` filas (DB_FETCH_SIZE por defecto).
+    - Toma su propia conexión del pool durante la iteración, para que la solicitud pueda seguir
+      usando execute_query mientras tanto.
+    - Si el consumidor abandona la iteración a medias, la conexión se descarta en lugar de leer
+      el resto del resultado.
+    """
+    fetch_size = fetch_size or current_app.config.get('DB_FETCH_SIZE', 500)
+
+    # Los recorridos grandes también se leen de la réplica si está disponible
+    pool, entry = None, None
+    if _replica_available():
+        try:
+            pool, entry = replica_pool, replica_pool.acquire()
+        except DatabaseError as err:
+            _mark_replica_down(err)
+    if entry is None:
+        pool = get_pool()
+        entry = pool.acquire()
+    cursor = None
+    exhausted = False
+    db_time = 0.0   # Solo el tiempo en la DB, sin contar el que tarda el consumidor
+    total_rows = 0
+
+    try:
+        start = time.perf_counter()
+        cursor = entry.conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, params or ())
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            db_time += time.perf_counter() - start
+            if not rows:
+                break
+            total_rows += len(rows)
+            yield from rows
+            start = time.perf_counter()
+        exhausted = True
+
+    except DatabaseError as err:
+        current_app.logger.error(f"Error SQL (iter_query): {err} | Query: {query} | Params: {params}")
+        raise
+    finally:
+        # La conexión vuelve al pool antes que nada: el generador puede cerrarse fuera del contexto
+        # de la solicitud (record_query necesita `g`) y un error al registrar no debe perderla
+        try:
+            if exhausted:
+                cursor.close()
+        finally:
+            pool.release(entry, discard=not exhausted)
+        if has_app_context():
+            try:
+                record_query(query, db_time, total_rows)
+            except Exception as e:
+                current_app.logger.error(f"No se pudo registrar la consulta de iter_query: {e}")
+
+def execute_many(query, params_seq, chunk_size=500):
+    """
+    Ejecuta la misma sentencia de escritura para muchas filas en UNA sola transacción
+    (o dentro de la transacción actual si se llama desde `transaction()`).
+    - Los INSERT ... VALUES se envían como INSERT multi-fila (executemany del conector),
+      en bloques de `chunk_size` filas para no exceder max_allowed_packet.
+    - Devuelve el total de filas afectadas (int); 0 si falla (se revierte el lote completo).
+    """
+    conn = get_db()
+    g.db_wrote = True
+    cursor = conn.cursor()
+    total = 0
+    start = time.perf_counter()
+
+    try:
+        params_iter = iter(params_seq)
+        while True:
+            chunk = list(islice(params_iter, chunk_size))
+            if not chunk:
+                break
+            cursor.executemany(query, chunk)
+            total += cursor.rowcount
+
+        if not _in_transaction():
+            conn.commit()
+        return total
+
+    except DatabaseError as err:
+        current_app.logger.error(f"Error SQL (lote): {err} | Query: {query} | Filas procesadas: {total}")
+        if _in_transaction():
+            raise
+        conn.rollback()
+        return 0
+    finally:
+        record_query(query, time.perf_counter() - start, total)
         cursor.close()
 
 def login_required(f):
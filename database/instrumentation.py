@@ -0,0 +1,88 @@
+from flask import current_app, g, request, has_request_context
+import threading
+
+# Estadísticas agregadas por endpoint (por proceso/worker)
+_endpoint_stats = {}
+_endpoint_stats_lock = threading.Lock()
+
+
+def _endpoint_actual():
+    """Nombre del endpoint que originó la consulta ('sin_solicitud' fuera de una petición)."""
+    if has_request_context():
+        return request.endpoint or 'desconocido'
+    return 'sin_solicitud'
+
+
+def record_query(query, duration, rows):
+    """
+    Registra una sentencia ejecutada en el colector de la solicitud actual (g.sql_log)
+    y la envía al log de consultas lentas si supera SLOW_QUERY_MS.
+    """
+    duration_ms = duration * 1000
+    endpoint = _endpoint_actual()
+
+    if 'sql_log' not in g:
+        g.sql_log = []
+    g.sql_log.append({
+        'sql': ' '.join(query.split())[:200],
+        'duration_ms': round(duration_ms, 3),
+        'rows': rows,
+        'endpoint': endpoint,
+    })
+
+    slow_ms = current_app.config.get('SLOW_QUERY_MS', 200)
+    if slow_ms is not None and duration_ms >= slow_ms:
+        # No se registran los parámetros: pueden contener datos personales de pacientes
+        current_app.logger.warning(
+            f"Consulta lenta ({duration_ms:.1f} ms, {rows} filas) en '{endpoint}': {' '.join(query.split())}"
+        )
+
+
+def _totales_solicitud():
+    sql_log = g.get('sql_log') or []
+    return len(sql_log), sum(item['duration_ms'] for item in sql_log)
+
+
+def add_server_timing(response):
+    """Agrega el encabezado Server-Timing con el número de consultas y el tiempo total en la DB."""
+    if current_app.config.get('SQL_SERVER_TIMING', True):
+        total_queries, total_ms = _totales_solicitud()
+        response.headers.add('Server-Timing', f'db;dur={total_ms:.1f};desc="{total_queries} consultas"')
+    return response
+
+
+def collect_endpoint_stats(exception=None):
+    """Acumula el conteo y la latencia de consultas de la solicitud en las estadísticas por endpoint."""
+    if not has_request_context() or request.endpoint is None:
+        return
+    total_queries, total_ms = _totales_solicitud()
+
+    with _endpoint_stats_lock:
+        stats = _endpoint_stats.setdefault(request.endpoint, {
+            'requests': 0, 'queries': 0, 'db_time_ms': 0.0, 'max_request_db_time_ms': 0.0, 'max_queries': 0,
+        })
+        stats['requests'] += 1
+        stats['queries'] += total_queries
+        stats['db_time_ms'] += total_ms
+        stats['max_request_db_time_ms'] = max(stats['max_request_db_time_ms'], total_ms)
+        stats['max_queries'] = max(stats['max_queries'], total_queries)
+
+
+def get_endpoint_stats():
+    """Devuelve una copia de las estadísticas por endpoint con promedios por solicitud."""
+    with _endpoint_stats_lock:
+        resultado = {}
+        for endpoint, stats in _endpoint_stats.items():
+            resultado[endpoint] = dict(stats)
+            resultado[endpoint]['db_time_ms'] = round(stats['db_time_ms'], 3)
+            resultado[endpoint]['max_request_db_time_ms'] = round(stats['max_request_db_time_ms'], 3)
+            resultado[endpoint]['avg_queries'] = round(stats['queries'] / stats['requests'], 2)
+            resultado[endpoint]['avg_db_time_ms'] = round(stats['db_time_ms'] / stats['requests'], 3)
+        return resultado
+
+
+def init_app(app):
+    """Registra los hooks de instrumentación SQL en la aplicación."""
+    app.after_request(add_server_timing)
+    # teardown_request también cubre las respuestas en streaming (iter_query)
+    app.teardown_request(collect_endpoint_stats)
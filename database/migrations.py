@@ -0,0 +1,408 @@
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+Uso (desde la raíz del proyecto):
+    python -m database.migrations status    # Versión actual y migraciones pendientes
+    python -m database.migrations upgrade   # Aplica las migraciones pendientes
+    python -m database.migrations verify    # EXPLAIN de las consultas calientes; falla si alguna hace full scan
+"""
+import argparse
+import re
+import sys
+
+from flask import current_app
+
+from database.backends import DatabaseError, is_already_exists_error, is_duplicate_entry_error
+from database.connection import get_db, get_backend
+from routes.enfermero import QUERY_QRS_PENDIENTES
+from utils.kpis import QUERY_KPIS
+from utils.metricas import (
+    QUERY_CAMPANAS, QUERY_METRICAS_CAMPANA, QUERY_RESUMEN_CAMPANA, QUERY_RESUMEN_TOTAL, QUERY_VERSION, VERSION_METRICAS
+)
+
+
+# --- DEFINICIÓN DE MIGRACIONES ---
+# Cada migración: (versión, descripción, [sentencias]). Nunca se edita una migración ya
+# publicada; los cambios nuevos se agregan como una versión nueva al final de la lista.
+
+MIGRATIONS = [
+    (1, "Esquema inicial de tablas usadas por routes/*", [
+        """
+        CREATE TABLE IF NOT EXISTS rol (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(50) NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "INSERT IGNORE INTO rol (id, nombre) VALUES (1, 'Doctor'), (2, 'Enfermero')",
+        """
+        CREATE TABLE IF NOT EXISTS usuario (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            usuario VARCHAR(150) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            rol_id INT NOT NULL,
+            CONSTRAINT fk_usuario_rol FOREIGN KEY (rol_id) REFERENCES rol (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS personal (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(150) NOT NULL,
+            fecha_nacimiento DATE NULL,
+            cedula_profesional VARCHAR(30) NULL,
+            email VARCHAR(150) NOT NULL,
+            telefono VARCHAR(20) NULL,
+            usuario_id INT NOT NULL,
+            CONSTRAINT fk_personal_usuario FOREIGN KEY (usuario_id) REFERENCES usuario (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS estados (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS municipios (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(150) NOT NULL,
+            estado INT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS colonias (
+            id INT PRIMARY KEY,
+            nombre VARCHAR(150) NOT NULL,
+            codigo_postal VARCHAR(10) NULL,
+            municipio INT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS paciente (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            apellido_paterno VARCHAR(100) NOT NULL,
+            apellido_materno VARCHAR(100) NULL,
+            sexo VARCHAR(20) NOT NULL,
+            edad INT NULL,
+            telefono VARCHAR(20) NULL,
+            ocupacion VARCHAR(100) NULL,
+            id_estado INT NULL,
+            id_municipio INT NULL,
+            id_colonia INT NULL,
+            codigo_postal VARCHAR(10) NULL,
+            resultado VARCHAR(20) NULL,
+            fecha_registro DATETIME NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS qr (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            codigo VARCHAR(64) NOT NULL,
+            numero_campana VARCHAR(50) NOT NULL,
+            fecha_entrega DATE NOT NULL,
+            estado VARCHAR(20) NOT NULL DEFAULT 'Generado',
+            id_estado INT NULL,
+            id_municipio INT NULL,
+            id_colonia INT NULL,
+            codigo_postal VARCHAR(10) NULL,
+            paciente_id INT NULL,
+            CONSTRAINT fk_qr_paciente FOREIGN KEY (paciente_id) REFERENCES paciente (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (2, "Índices y restricciones únicas para las rutas calientes", [
+        # Búsquedas por código (acceso_qr, vincular_con_codigo, descargar_qr): único
+        "CREATE UNIQUE INDEX ux_qr_codigo ON qr (codigo)",
+        # Filtros por campaña y vinculados por campaña (reportes, consultar_campana)
+        "CREATE INDEX ix_qr_campana_paciente ON qr (numero_campana, paciente_id)",
+        # QRs pendientes ordenados por fecha (dashboard de enfermería, vincular_inicio)
+        "CREATE INDEX ix_qr_estado_paciente_fecha ON qr (estado, paciente_id, fecha_entrega)",
+        "CREATE INDEX ix_qr_fecha_entrega ON qr (fecha_entrega)",
+        # JOIN paciente <-> qr
+        "CREATE INDEX ix_qr_paciente ON qr (paciente_id)",
+        "CREATE INDEX ix_paciente_resultado ON paciente (resultado)",
+        "CREATE INDEX ix_paciente_fecha_registro ON paciente (fecha_registro)",
+        # Login y perfil
+        "CREATE UNIQUE INDEX ux_usuario_usuario ON usuario (usuario)",
+        "CREATE UNIQUE INDEX ux_personal_usuario ON personal (usuario_id)",
+        # Catálogos de ubicación (filtrado en cascada)
+        "CREATE INDEX ix_municipios_estado ON municipios (estado)",
+        "CREATE INDEX ix_colonias_municipio ON colonias (municipio)",
+    ]),
+    (3, "Resumen incremental de métricas por campaña (llenar con: python -m utils.metricas reconstruir)", [
+        """
+        CREATE TABLE IF NOT EXISTS resumen_campana (
+            numero_campana VARCHAR(50) NOT NULL,
+            metrica VARCHAR(40) NOT NULL,
+            cantidad INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (numero_campana, metrica)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (4, "Serie diaria por campaña para tendencias (llenar con: python -m utils.metricas reconstruir)", [
+        """
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            numero_campana VARCHAR(50) NOT NULL,
+            fecha DATE NOT NULL,
+            metrica VARCHAR(40) NOT NULL,
+            cantidad INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (numero_campana, fecha, metrica)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        # Rango de fechas sin filtro de campaña (cubre la consulta de tendencias)
+        "CREATE INDEX ix_resumen_diario_fecha ON resumen_diario (fecha, metrica, cantidad)",
+    ]),
+    (5, "Cubo geográfico estado > municipio > colonia (llenar con: python -m utils.metricas reconstruir)", [
+        """
+        CREATE TABLE IF NOT EXISTS resumen_geografico (
+            numero_campana VARCHAR(50) NOT NULL,
+            nivel VARCHAR(10) NOT NULL,
+            padre_id INT NOT NULL,
+            area_id INT NOT NULL,
+            metrica VARCHAR(40) NOT NULL,
+            cantidad INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (nivel, padre_id, area_id, numero_campana, metrica)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (6, "Contador de versión de los datos de métricas (ETag de /doctor/api/metricas)", [
+        """
+        CREATE TABLE IF NOT EXISTS version_datos (
+            nombre VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "INSERT IGNORE INTO version_datos (nombre, version) VALUES ('metricas', 0)",
+    ]),
+    (7, "Índice cubriente de pacientes evaluados por sexo y edad (reemplaza ix_paciente_resultado)", [
+        # utils/metricas: QUERY_METRICAS_TODAS agrupa (resultado, sexo, edad) leyendo solo el índice.
+        # Sigue sirviendo a los filtros por resultado (KPIs), así que el índice anterior sobra.
+        "CREATE INDEX ix_paciente_resultado_sexo_edad ON paciente (resultado, sexo, edad)",
+        "DROP INDEX ix_paciente_resultado ON paciente",
+    ]),
+    (8, "Índice de resumen_campana por métrica", [
+        # utils/metricas: QUERY_CAMPANAS busca metrica = 'generados' y QUERY_RESUMEN_TOTAL agrupa por
+        # métrica; ambas se resuelven en el índice, en orden y sin leer la tabla
+        "CREATE INDEX ix_resumen_campana_metrica ON resumen_campana (metrica, numero_campana, cantidad)",
+    ]),
+]
+
+
+# --- CONSULTAS CALIENTES A VERIFICAR CON EXPLAIN ---
+# (nombre, sql, parámetros de ejemplo)
+
+HOT_QUERIES = [
+    ("paciente.acceso_qr",
+     "SELECT q.paciente_id, q.estado, p.resultado FROM qr q LEFT JOIN paciente p ON q.paciente_id = p.id WHERE q.codigo = %s",
+     ('00000000-0000-0000-0000-000000000000',)),
+    ("enfermero.vincular_con_codigo",
+     "SELECT id, estado, paciente_id FROM qr WHERE codigo = %s",
+     ('00000000-0000-0000-0000-000000000000',)),
+    ("dashboards (KPIs de doctor y enfermero)",
+     QUERY_KPIS,
+     ('2000-01-01 00:00:00',)),
+    ("enfermero.dashboard (tabla)",
+     "SELECT id, codigo, fecha_entrega FROM qr WHERE estado = 'Generado' AND paciente_id IS NULL ORDER BY fecha_entrega DESC LIMIT 10",
+     ()),
+    ("enfermero.vincular_inicio (primera página)",
+     QUERY_QRS_PENDIENTES.format(despues=''),
+     (61,)),
+    ("enfermero.vincular_inicio (página siguiente)",
+     QUERY_QRS_PENDIENTES.format(despues="AND (fecha_entrega < %s OR (fecha_entrega = %s AND id < %s))"),
+     ('2025-01-01', '2025-01-01', 1000, 61)),
+    ("enfermero.pacientes",
+     "SELECT p.id, q.codigo FROM paciente p JOIN qr q ON p.id = q.paciente_id WHERE q.estado = 'Vinculado' ORDER BY p.id DESC",
+     ()),
+    ("doctor.consultar_campana",
+     "SELECT q.numero_campana, q.estado FROM qr q WHERE q.numero_campana = %s LIMIT 1",
+     ('1',)),
+    ("doctor.reportes (resumen por campaña)",
+     QUERY_RESUMEN_CAMPANA,
+     ('1',)),
+    ("doctor.reportes (resumen de todas las campañas)",
+     QUERY_RESUMEN_TOTAL,
+     ()),
+    ("doctor.reportes (lista de campañas)",
+     QUERY_CAMPANAS,
+     ()),
+    ("doctor.reportes (cálculo directo por campaña, sin resumen)",
+     QUERY_METRICAS_CAMPANA,
+     ('1', '1', '1')),
+    ("doctor.api_tendencias",
+     "SELECT fecha, metrica, SUM(cantidad) FROM resumen_diario WHERE fecha BETWEEN %s AND %s AND numero_campana = %s GROUP BY fecha, metrica",
+     ('2025-01-01', '2025-12-31', '1')),
+    ("doctor.api_geografico",
+     "SELECT g.area_id, g.metrica, SUM(g.cantidad) FROM resumen_geografico g WHERE g.nivel = %s AND g.padre_id = %s GROUP BY g.area_id, g.metrica",
+     ('municipio', 1)),
+    ("doctor.api_metricas (versión)",
+     QUERY_VERSION,
+     (VERSION_METRICAS,)),
+    ("auth.login",
+     "SELECT id, password, rol_id, usuario FROM usuario WHERE usuario = %s",
+     ('nadie@example.com',)),
+]
+
+
+# --- EJECUCIÓN ---
+
+def _version_table_exists(cursor):
+    if get_backend().name == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+    else:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = 'schema_migrations'"
+        )
+    return cursor.fetchone() is not None
+
+
+def _ensure_version_table(cursor):
+    # Se consulta antes de crearla: con raise_on_warnings, CREATE TABLE IF NOT EXISTS sobre una tabla
+    # existente emite la nota 1050 y el conector de MySQL la lanza como excepción
+    if _version_table_exists(cursor):
+        return
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            descripcion VARCHAR(200) NOT NULL,
+            aplicada_en DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+
+def current_version():
+    """Devuelve la versión del esquema aplicada (0 si nunca se migró)."""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        row = cursor.fetchone()
+        return int(row[0] or 0) if row else 0
+    finally:
+        cursor.close()
+
+
+def pending_migrations():
+    version = current_version()
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def upgrade(target=None):
+    """Aplica en orden las migraciones pendientes (hasta `target` si se indica). Devuelve las versiones aplicadas."""
+    conn = get_db()
+    aplicadas = []
+
+    for version, descripcion, sentencias in pending_migrations():
+        if target is not None and version > target:
+            break
+
+        cursor = conn.cursor()
+        try:
+            for sentencia in sentencias:
+                try:
+                    cursor.execute(sentencia)
+                except DatabaseError as err:
+                    # Objetos creados antes de las migraciones (bases de datos existentes)
+                    if is_already_exists_error(err):
+                        current_app.logger.info(f"Migración {version}: objeto existente, se omite ({err.msg})")
+                        continue
+                    # Filas de catálogo ya cargadas (INSERT IGNORE con raise_on_warnings)
+                    if is_duplicate_entry_error(err) and re.match(r'\s*INSERT\s+IGNORE\b', sentencia, re.I):
+                        current_app.logger.info(f"Migración {version}: filas existentes, se omiten ({err.msg})")
+                        continue
+                    raise
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, descripcion) VALUES (%s, %s)",
+                (version, descripcion)
+            )
+            conn.commit()
+            aplicadas.append(version)
+        except DatabaseError:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    return aplicadas
+
+
+def _explain(conn, sql, params):
+    """
+    Devuelve el plan de `sql` normalizado como [(tabla, full_scan, índices_posibles)].
+    MySQL: EXPLAIN (type=ALL). SQLite: EXPLAIN QUERY PLAN ('SCAN tabla' sin índice).
+    Las tablas derivadas (subconsultas en FROM) no cuentan: su costo está en el plan de la subconsulta.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if get_backend().name == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan, derivadas = [], set()
+            for fila in cursor.fetchall():
+                detalle = str(fila.get('detail') or '')
+                coincidencia = re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\w+)$', detalle)
+                if coincidencia:
+                    derivadas.add(coincidencia.group(1))
+                    continue
+                coincidencia = re.match(r'SCAN (\w+)(?: AS \w+)?$', detalle)
+                if coincidencia and coincidencia.group(1) not in derivadas:
+                    plan.append((coincidencia.group(1), True, None))
+            return plan
+
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return [
+            (fila.get('table'), str(fila.get('type') or '').upper() == 'ALL', fila.get('possible_keys'))
+            for fila in cursor.fetchall()
+            if not str(fila.get('table') or '').startswith('<derived')
+        ]
+    finally:
+        cursor.close()
+
+
+def verify():
+    """
+    Ejecuta EXPLAIN sobre las consultas calientes. Devuelve la lista de fallos: cualquier tabla que
+    se recorra completa, aunque exista un índice posible (con tablas casi vacías el optimizador
+    puede preferir el recorrido completo: verificar con datos representativos).
+    """
+    conn = get_db()
+    fallos = []
+
+    for nombre, sql, params in HOT_QUERIES:
+        for tabla, full_scan, posibles in _explain(conn, sql, params):
+            if full_scan:
+                fallos.append(f"{nombre}: full scan sobre '{tabla}'" + (f" (índices posibles: {posibles})" if posibles else ""))
+
+    return fallos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de AUTOTESTS_VIH")
+    parser.add_argument('comando', choices=['status', 'upgrade', 'verify'])
+    parser.add_argument('--target', type=int, default=None, help="Versión máxima a aplicar (upgrade)")
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    with app.app_context():
+        if args.comando == 'status':
+            print(f"Versión actual: {current_version()}")
+            for version, descripcion, _ in pending_migrations():
+                print(f"  Pendiente {version}: {descripcion}")
+            return 0
+
+        if args.comando == 'upgrade':
+            aplicadas = upgrade(args.target)
+            print(f"Migraciones aplicadas: {aplicadas or 'ninguna'} (versión actual: {current_version()})")
+            if {3, 4, 5} & set(aplicadas):
+                print("Ejecuta 'python -m utils.metricas reconstruir' para llenar los resúmenes de métricas.")
+            return 0
+
+        fallos = verify()
+        for fallo in fallos:
+            print(f"FALLO: {fallo}")
+        print("Verificación correcta." if not fallos else f"{len(fallos)} recorrido(s) completo(s).")
+        return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
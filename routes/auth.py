@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
-from database.connection import execute_query
+from database.connection import execute_query, transaction
 from flask_mail import Message
 
 auth_bp = Blueprint('auth_bp', __name__, url_prefix='/auth') 
@@ -25,11 +25,12 @@ def registrar():
             return render_template('auth/registrar.html')
 
         try:
-            # 2. Insertar en tabla usuario
-            query_usuario = "INSERT INTO usuario (usuario, password, rol_id) VALUES (%s, %s, %s)"
-            usuario_id = execute_query(query_usuario, (email, password, rol_id), commit=True)
+            # usuario y personal se crean en una sola transacción (un COMMIT, sin cuentas a medias)
+            with transaction():
+                # 2. Insertar en tabla usuario
+                query_usuario = "INSERT INTO usuario (usuario, password, rol_id) VALUES (%s, %s, %s)"
+                usuario_id = execute_query(query_usuario, (email, password, rol_id), commit=True)
 
-            if usuario_id:
                 # 3. Insertar perfil detallado en tabla personal
                 query_personal = """
                     INSERT INTO personal (nombre, fecha_nacimiento, cedula_profesional, 
@@ -39,8 +40,8 @@ def registrar():
                 execute_query(query_personal, (nombres, fecha_nacimiento, cedula, 
                                              email, telefono, usuario_id), commit=True)
                 
-                flash("Cuenta creada exitosamente. Ya puede iniciar sesión.", "success")
-                return redirect(url_for('auth_bp.login'))
+            flash("Cuenta creada exitosamente. Ya puede iniciar sesión.", "success")
+            return redirect(url_for('auth_bp.login'))
             
         except Exception as e:
             current_app.logger.error(f"Error en el registro: {e}")
@@ -57,7 +58,7 @@ def login():
         password_input = request.form.get('password') 
         
         query_user = "SELECT id, password, rol_id, usuario FROM usuario WHERE usuario = %s"
-        user_data = execute_query(query_user, (email_input,), fetch_one=True)
+        user_data = execute_query(query_user, (email_input,), fetch_one=True, prepared=True)
         
         if user_data:
             db_password = str(user_data['password']).strip()
@@ -1,8 +1,16 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request, send_file, current_app, jsonify
-from database.connection import execute_query 
-from datetime import datetime
+from flask import Blueprint, render_template, session, redirect, url_for, flash, request, send_file, current_app, jsonify, Response, stream_with_context
+from database.connection import execute_query, execute_many, transaction, get_pool_stats, get_replica_stats 
+from database.instrumentation import get_endpoint_stats 
+from utils.kpis import obtener_kpis, invalidar_kpis, get_kpi_cache_stats 
+from utils.exportacion import (FORMATOS as FORMATOS_EXPORTACION, FORMATOS_COLUMNARES, leer_filas, comprimir_gzip,
+                               arrow_disponible) 
+from utils.analitica import DIMENSIONES, obtener_cubo, tabla_cruzada 
+from utils.qr_manager import matrices_qr, render_qr, dibujar_qr, get_qr_cache_stats 
+from utils.metricas import (leer_resumen, listar_campanas, registrar_qrs_generados, calcular_resumen_directo, formatear_metricas,
+                            obtener_cacheado, invalidar_reportes, get_reportes_cache_stats, leer_tendencias,
+                            leer_geografico, NIVELES_GEOGRAFICOS, leer_resumenes, leer_version) 
+from datetime import datetime, timedelta
 from functools import wraps 
-import qrcode
 from io import BytesIO
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
@@ -11,7 +19,9 @@ import uuid
 import json 
 from decimal import Decimal 
 import zipfile 
-import os 
+import os
+import tempfile
+import time 
 
 #  CONFIGURACIÓN DE RUTAS Y CONSTANTES 
 IP_DEL_SERVIDOR = '192.168.8.31' 
@@ -50,22 +60,16 @@ doctor_bp = Blueprint('doctor_bp', __name__, url_prefix='/doctor')
 
 
 def obtener_campanas_disponibles():
-    """Retorna una lista de todas las campañas únicas con su conteo de QRs."""
-    query = """
-    SELECT 
-        numero_campana, 
-        COUNT(id) as total_qrs
-    FROM qr 
-    GROUP BY numero_campana
-    ORDER BY numero_campana DESC;
-    """
-    return execute_query(query) or []
+    """Retorna una lista de todas las campañas únicas con su conteo de QRs (desde resumen_campana)."""
+    return listar_campanas() or []
 
 
 def calcular_metricas_reporte(campana_id=None):
     """
-    Consulta la DB para obtener todas las métricas necesarias para los reportes, 
-    opcionalmente filtrando por numero_campana.
+    Obtiene todas las métricas necesarias para los reportes, opcionalmente filtrando por numero_campana.
+    Lee el resumen pre-agregado por campaña (utils/metricas.py): el costo depende del número
+    de campañas, no del total de pacientes. Si resumen_campana no se puede leer (p. ej. la
+    migración aún no se aplicó) se calculan desde qr/paciente en una sola consulta parametrizada.
     """
     
     default_metricas = {
@@ -81,138 +85,101 @@ def calcular_metricas_reporte(campana_id=None):
     }
     
     try:
-        # 1. Definir la condición WHERE basada en el filtro de campaña
-        
-        where_qr = ""
-        where_paciente = "WHERE p.resultado IS NOT NULL"
-        
-        if campana_id:
-            where_qr = f"WHERE numero_campana = '{campana_id}'"
-            where_paciente = f"""
-                WHERE p.resultado IS NOT NULL 
-                AND p.id IN (
-                    SELECT paciente_id 
-                    FROM qr 
-                    WHERE numero_campana = '{campana_id}' AND paciente_id IS NOT NULL
-                )
-            """
-        
-        # 2. Conteo General - CORRECCIÓN DE LA SINTAXIS SQL APLICADA AQUÍ:
-        
-        if not campana_id:
-            where_vinculados = "WHERE paciente_id IS NOT NULL"
-        else:
-            where_vinculados = f"WHERE numero_campana = '{campana_id}' AND paciente_id IS NOT NULL"
-
-        
-        query_general = f"""
-        SELECT 
-            (SELECT COUNT(id) FROM qr {where_qr}) as codigos_generados,
-            (SELECT COUNT(id) FROM qr {where_vinculados}) as codigos_vinculados,
-            
-            SUM(CASE WHEN p.resultado = 'Positivo' THEN 1 ELSE 0 END) as positivos,
-            SUM(CASE WHEN p.resultado = 'Negativo' THEN 1 ELSE 0 END) as negativos,
-            COUNT(p.id) as total_evaluaciones
-        FROM paciente p 
-        {where_paciente};
-        """
-        general_data = execute_query(query_general, fetch_one=True)
-        
-        if not general_data:
+        resumen = leer_resumen(campana_id)
+        if resumen is None:
+            current_app.logger.error("No se pudo leer resumen_campana; las métricas se calculan desde qr y paciente")
+            resumen = calcular_resumen_directo(campana_id)
+        if resumen is None:
             return default_metricas
+        return formatear_metricas(resumen)
 
-        # Conversión segura de tipos
-        total = int(general_data.get('total_evaluaciones', 0) or 0)
-        positivos = int(general_data.get('positivos', 0) or 0)
-        negativos = int(general_data.get('negativos', 0) or 0)
-        
-        codigos_generados = int(general_data.get('codigos_generados', 0) or 0)
-        codigos_vinculados = int(general_data.get('codigos_vinculados', 0) or 0)
+    except Exception as e:
+        current_app.logger.error(f"Error CRÍTICO en calcular_metricas_reporte (DB): {e}")
+        return default_metricas
 
-        # Cálculo de tasas de forma segura
-        tasa_positividad = round((float(positivos) / total) * 100, 1) if total > 0 else 0.0
-        tasa_negativa = round((float(negativos) / total) * 100, 1) if total > 0 else 0.0
+def obtener_reporte_cacheado(campana_id=None):
+    """
+    Métricas y lista de campañas para la página de reportes desde el cache stale-while-revalidate:
+    se sirve el último cálculo y, si es más viejo que REPORT_CACHE_MAX_AGE, se recalcula en segundo plano.
+    Devuelve (metricas, campanas_disponibles, calculado_en); calculado_en es None si no hubo cache.
+    """
+    # Los cargadores lanzan excepción si la DB falla: así no se reemplazan datos buenos por vacíos
+    def cargar_metricas():
+        resumen = leer_resumen(campana_id)
+        if resumen is None:
+            raise RuntimeError(f"No se pudieron leer las métricas de la campaña '{campana_id or 'todas'}'")
+        return formatear_metricas(resumen)
+
+    def cargar_campanas():
+        campanas = listar_campanas()
+        if campanas is None:
+            raise RuntimeError("No se pudo leer la lista de campañas")
+        return campanas
+
+    try:
+        campanas, campanas_en = obtener_cacheado(('campanas',), cargar_campanas)
+        # Solo se cachean campañas conocidas: campana_id viene de la URL y con valores arbitrarios
+        # el cache crecería sin límite. Las desconocidas se leen directo (una consulta por llave).
+        if campana_id and campana_id not in {c['numero_campana'] for c in campanas}:
+            return calcular_metricas_reporte(campana_id), campanas, datetime.fromtimestamp(campanas_en)
+        metricas, metricas_en = obtener_cacheado(('metricas', campana_id or ''), cargar_metricas)
+        return metricas, campanas, datetime.fromtimestamp(min(metricas_en, campanas_en))
+    except Exception as e:
+        current_app.logger.error(f"Error en el cache de reportes, se calcula sin cache: {e}")
+        return calcular_metricas_reporte(campana_id), obtener_campanas_disponibles(), None
 
 
-        # 3. Distribución por Sexo
-        query_sexo = f"""
-        SELECT 
-            UPPER(p.sexo) as sexo, 
-            COUNT(p.id) as total_sexo
-        FROM paciente p
-        {where_paciente}
-        GROUP BY p.sexo;
-        """
-        data_sexo = execute_query(query_sexo) or []
+def dibujar_hojas_qr(c, codigos, numero_campana, codigo_postal, id_colonia):
+    """
+    Dibuja en el canvas `c` las hojas de entrega del lote: tres QRs por página con sus datos.
+    Las matrices QR se calculan antes, en paralelo y en orden (utils/qr_manager.matrices_qr).
+    """
+    width, height = letter
+    x_margin = 60
+    y_start = height - 50
+    qr_size = 180 
+    line_spacing = 30
+
+    urls = [f"{BASE_URL}{url_for('paciente_bp.acceso_qr', qr_codigo=codigo)}" for codigo in codigos]
+    matrices = matrices_qr(urls)
+    
+    for index, (codigo, matriz) in enumerate(zip(codigos, matrices)):
+        if index > 0 and index % 3 == 0:
+            c.showPage()
+        
+        y_position = y_start - (index % 3) * 220 
         
-        distribucion_sexo = {'H': 0, 'M': 0, 'O': 0}
-        for item in data_sexo:
-            sexo_db_val = str(item.get('sexo', 'O')).upper().strip() 
-            total_casos = int(item.get('total_sexo', 0))
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(x_margin, y_position, f"Campaña: {numero_campana}")
+        c.setFont("Helvetica", 10)
+        y_position -= line_spacing
+        c.drawString(x_margin, y_position, f"CP: {codigo_postal} (Colonia ID: {id_colonia})") 
+        y_position -= line_spacing
+        c.drawString(x_margin, y_position, f"Código QR: {codigo}")
 
-            if 'MASCULINO' in sexo_db_val or sexo_db_val == 'H' or sexo_db_val == 'M':
-                distribucion_sexo['H'] += total_casos
-            elif 'FEMENINO' in sexo_db_val or sexo_db_val == 'F':
-                distribucion_sexo['M'] += total_casos
-            else:
-                distribucion_sexo['O'] += total_casos
+        # El QR se dibuja como vectores desde la matriz: sin imagen embebida
+        dibujar_qr(c, matriz, x_margin + 300, y_position - qr_size + 30, qr_size)
+    c.showPage()
 
 
-        # 4. Distribución por Rango de Edad
-        query_edad = f"""
-        SELECT 
-            CASE 
-                WHEN p.edad BETWEEN 0 AND 5 THEN '0-5 años'
-                WHEN p.edad BETWEEN 6 AND 10 THEN '6-10 años'
-                WHEN p.edad BETWEEN 11 AND 17 THEN '11-17 años'
-                WHEN p.edad BETWEEN 18 AND 24 THEN '18-24 años'
-                WHEN p.edad BETWEEN 25 AND 34 THEN '25-34 años'
-                WHEN p.edad BETWEEN 35 AND 44 THEN '35-44 años'
-                WHEN p.edad BETWEEN 45 AND 54 THEN '45-54 años'
-                WHEN p.edad >= 55 THEN '55+ años'
-                ELSE 'No especificado'
-            END as rango_edad,
-            COUNT(p.id) as total,
-            
-            CASE 
-                WHEN p.edad BETWEEN 0 AND 5 THEN 1
-                WHEN p.edad BETWEEN 6 AND 10 THEN 2
-                WHEN p.edad BETWEEN 11 AND 17 THEN 3
-                WHEN p.edad BETWEEN 18 AND 24 THEN 4
-                WHEN p.edad BETWEEN 25 AND 34 THEN 5
-                WHEN p.edad BETWEEN 35 AND 44 THEN 6
-                WHEN p.edad BETWEEN 45 AND 54 THEN 7
-                WHEN p.edad >= 55 THEN 8
-                ELSE 9
-            END as rango_orden
-            
-        FROM paciente p
-        {where_paciente} AND p.edad IS NOT NULL
-        GROUP BY rango_edad, rango_orden
-        ORDER BY rango_orden; 
-        """
-        data_edad = execute_query(query_edad) or []
-
-        distribucion_edad = {}
-        for item in data_edad:
-            distribucion_edad[str(item.get('rango_edad', 'N/D'))] = int(item.get('total', 0))
-        
-        # Retorno final
-        return {
-            'codigos_generados': codigos_generados,
-            'codigos_vinculados': codigos_vinculados,
-            'total_evaluaciones': total,
-            'casos_positivos': positivos,
-            'casos_negativos': negativos,
-            'tasa_positividad': tasa_positividad, 
-            'tasa_negativa': tasa_negativa,      
-            'distribucion_sexo': distribucion_sexo,
-            'distribucion_edad': distribucion_edad
-        }
+def generar_zip_lote(codigos, nombre_lote, numero_campana, codigo_postal, id_colonia):
+    """
+    ZIP con un PDF por cada QR_LOTE_POR_PDF códigos, escrito en un archivo temporal que pasa a disco
+    después de QR_LOTE_SPOOL_BYTES. ReportLab guarda en memoria el documento completo hasta `save()`:
+    al partir el lote, la memoria queda acotada por el tamaño de una parte y no por el del lote.
+    """
+    por_parte = current_app.config['QR_LOTE_POR_PDF']
+    archivo = tempfile.SpooledTemporaryFile(max_size=current_app.config['QR_LOTE_SPOOL_BYTES'])
+    # Los PDFs ya vienen comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(archivo, 'w', zipfile.ZIP_STORED, allowZip64=True) as zip_lote:
+        for numero, inicio in enumerate(range(0, len(codigos), por_parte), start=1):
+            with zip_lote.open(f"{nombre_lote}_parte{numero:03d}.pdf", 'w', force_zip64=True) as destino:
+                c = canvas.Canvas(destino, pagesize=letter)
+                dibujar_hojas_qr(c, codigos[inicio:inicio + por_parte], numero_campana, codigo_postal, id_colonia)
+                c.save()
+    archivo.seek(0)
+    return archivo
 
-    except Exception as e:
-        current_app.logger.error(f"Error CRÍTICO en calcular_metricas_reporte (DB): {e}")
-        return default_metricas
 
 def cargar_datos_ubicacion():
     """Consulta y retorna todos los estados, municipios y colonias."""
@@ -245,24 +212,11 @@ def cargar_datos_ubicacion():
 @doctor_login_required 
 def dashboard():
     
-    qrs_generados = 0
-    qrs_vinculados = 0
-    pacientes_positivos = 0
     ultimos_qrs_tabla = [] 
     
     try:
-        # Consultas para los KPI's del dashboard
-        query_generados = "SELECT COUNT(id) AS total FROM qr"
-        query_vinculados = "SELECT COUNT(id) AS total FROM qr WHERE paciente_id IS NOT NULL"
-        query_positivos = "SELECT COUNT(id) AS total FROM paciente WHERE resultado = 'Positivo'"
-        
-        generados_data = execute_query(query_generados, fetch_one=True)
-        vinculados_data = execute_query(query_vinculados, fetch_one=True)
-        positivos_data = execute_query(query_positivos, fetch_one=True)
-
-        if generados_data: qrs_generados = generados_data.get('total', 0)
-        if vinculados_data: qrs_vinculados = vinculados_data.get('total', 0)
-        if positivos_data: pacientes_positivos = positivos_data.get('total', 0)
+        # KPI's del dashboard (una sola consulta agregada, cacheada unos segundos)
+        kpis = obtener_kpis()
         
         # Consulta para la tabla de Últimos QRs Generados
         query_ultimos = """
@@ -283,9 +237,9 @@ def dashboard():
         return redirect(url_for('auth_bp.login')) 
 
     return render_template('doctor/dashboard.html',
-                           qrs_generados=qrs_generados,
-                           qrs_vinculados=qrs_vinculados,
-                           pacientes_positivos=pacientes_positivos,
+                           qrs_generados=kpis['qrs_generados'],
+                           qrs_vinculados=kpis['qrs_vinculados'],
+                           pacientes_positivos=kpis['pacientes_positivos'],
                            ultimos_qrs_tabla=ultimos_qrs_tabla)
 
 
@@ -295,11 +249,9 @@ def reportes():
     # Obtener el filtro de campaña de la URL
     campana_id = request.args.get('campana_id')
     
-    # 1. Obtener métricas (con o sin filtro)
-    metricas = calcular_metricas_reporte(campana_id)
-    
-    # 2. Obtener la lista de todas las campañas para el desplegable
-    campanas_disponibles = obtener_campanas_disponibles()
+    # 1. Obtener métricas (con o sin filtro) y 2. la lista de campañas para el desplegable,
+    #    desde el cache: nunca se espera a una agregación lenta salvo en la primera carga
+    metricas, campanas_disponibles, calculado_en = obtener_reporte_cacheado(campana_id)
 
     if not isinstance(metricas, dict):
         metricas = {}
@@ -315,7 +267,8 @@ def reportes():
     return render_template('doctor/reportes.html', 
                            metricas=metricas, 
                            metricas_json=metricas_json,
-                           campanas_disponibles=campanas_disponibles) # Pasar la lista al template
+                           campanas_disponibles=campanas_disponibles, # Pasar la lista al template
+                           calculado_en=calculado_en)
 
 
 
@@ -360,80 +313,66 @@ def generar_qr():
             estados_data, municipios_data, colonias_data = cargar_datos_ubicacion()
             return render_template('doctor/generar_qr.html', data=data, estados=estados_data, municipios=municipios_data, colonias=colonias_data, today=datetime.now().strftime('%Y-%m-%d'))
         
-        if cantidad_qr <= 0 or cantidad_qr > 100: # Limitamos a 100 por lote PDF
-            flash("La cantidad de QRs debe ser mayor a cero y menor a 100 por lote.", "warning")
+        # QR_LOTE_MAXIMO ya está limitado a lo que se genera dentro del timeout del worker (ver config.py)
+        lote_maximo = current_app.config['QR_LOTE_MAXIMO']
+        if cantidad_qr <= 0 or cantidad_qr > lote_maximo: # Lotes grandes: ZIP de PDFs (ver generar_zip_lote)
+            flash(f"La cantidad de QRs debe ser mayor a cero y como máximo {lote_maximo} por lote. "
+                  "Para más códigos genera varios lotes de la misma campaña.", "warning")
             estados_data, municipios_data, colonias_data = cargar_datos_ubicacion()
             return render_template('doctor/generar_qr.html', data=data, estados=estados_data, municipios=municipios_data, colonias=colonias_data, today=datetime.now().strftime('%Y-%m-%d'))
         
         estado = "Generado"
         qrs_generados_exitosamente = 0
-        codigos_generados = [] # Lista para el PDF
+        inicio_lote = time.perf_counter()
+        codigos_generados = [str(uuid.uuid4()) for _ in range(cantidad_qr)] # Lista para el PDF
 
         try:
-            # 2. Bucle para generar e insertar N códigos en la DB
-            for i in range(cantidad_qr):
-                codigo_qr_unico = str(uuid.uuid4())
-                
-                # --- CONSULTA INSERT FINAL (AJUSTADA A TU TABLA QR) ---
-                query = """
-                INSERT INTO qr 
-                (codigo, numero_campana, fecha_entrega, estado, id_estado, id_municipio, id_colonia, codigo_postal, paciente_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NULL)
-                """
-                params = (
-                    codigo_qr_unico, numero_campana, fecha_entrega, estado,
-                    id_estado, id_municipio, id_colonia, codigo_postal
-                )
-                
-                success = execute_query(query, params, commit=True)
-                
-                if success is not None and success > 0:
-                    qrs_generados_exitosamente += 1
-                    codigos_generados.append(codigo_qr_unico) # Guardar el código para el PDF
-                
+            # 2. Insertar los N códigos en la DB con INSERTs multi-fila (bloques de QR_LOTE_BLOQUE_INSERT) y un solo COMMIT
+            query = """
+            INSERT INTO qr 
+            (codigo, numero_campana, fecha_entrega, estado, id_estado, id_municipio, id_colonia, codigo_postal, paciente_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NULL)
+            """
+            params = [
+                (codigo_qr_unico, numero_campana, fecha_entrega, estado,
+                 id_estado, id_municipio, id_colonia, codigo_postal)
+                for codigo_qr_unico in codigos_generados
+            ]
+
+            # Los QRs y el contador de la campaña se confirman juntos
+            with transaction():
+                qrs_generados_exitosamente = execute_many(query, params, chunk_size=current_app.config['QR_LOTE_BLOQUE_INSERT'])
+                registrar_qrs_generados(numero_campana, qrs_generados_exitosamente, id_estado, id_municipio, id_colonia)
+            if qrs_generados_exitosamente > 0:
+                invalidar_kpis()
+                invalidar_reportes()
             
-            # 3. Generación y Envío del PDF
+            # 3. Generación y Envío del PDF (o del ZIP de PDFs en lotes grandes)
             if qrs_generados_exitosamente > 0:
-                pdf_buffer = BytesIO()
-                c = canvas.Canvas(pdf_buffer, pagesize=letter)
-                width, height = letter
-                
-                x_margin = 60
-                y_start = height - 50
-                qr_size = 180 
-                line_spacing = 30
-                
-                for index, codigo in enumerate(codigos_generados):
-                    if index > 0 and index % 3 == 0:
-                        c.showPage()
-                        y_start = height - 50
-                    
-                    y_position = y_start - (index % 3) * 220 
-                    
-                    url_para_qr = f"{BASE_URL}{url_for('paciente_bp.acceso_qr', qr_codigo=codigo)}" 
-                    
-                    c.setFont("Helvetica-Bold", 14)
-                    c.drawString(x_margin, y_position, f"Campaña: {numero_campana}")
-                    c.setFont("Helvetica", 10)
-                    y_position -= line_spacing
-                    c.drawString(x_margin, y_position, f"CP: {codigo_postal} (Colonia ID: {id_colonia})") 
-                    y_position -= line_spacing
-                    c.drawString(x_margin, y_position, f"Código QR: {codigo}")
-
-                    qr_img = qrcode.make(url_para_qr)
-                    img_buffer = BytesIO(); qr_img.save(img_buffer, "PNG"); img_buffer.seek(0)
-                    qr_image_reader = ImageReader(img_buffer)
-                    
-                    c.drawImage(qr_image_reader, x_margin + 300, y_position - qr_size + 30, width=qr_size, height=qr_size)
-                    
-                c.showPage(); c.save(); pdf_buffer.seek(0)
+                nombre_lote = f"QRs_Lote_{numero_campana}_{datetime.now().strftime('%Y%m%d')}"
+                if cantidad_qr <= current_app.config['QR_LOTE_PDF_MAXIMO']:
+                    pdf_buffer = BytesIO()
+                    c = canvas.Canvas(pdf_buffer, pagesize=letter)
+                    dibujar_hojas_qr(c, codigos_generados, numero_campana, codigo_postal, id_colonia)
+                    c.save(); pdf_buffer.seek(0)
+                    archivo, download_name, mimetype = pdf_buffer, f"{nombre_lote}.pdf", 'application/pdf'
+                else:
+                    archivo = generar_zip_lote(codigos_generados, nombre_lote, numero_campana, codigo_postal, id_colonia)
+                    download_name, mimetype = f"{nombre_lote}.zip", 'application/zip'
+
+                duracion = time.perf_counter() - inicio_lote
+                presupuesto = current_app.config['QR_LOTE_PRESUPUESTO_S'] * cantidad_qr / current_app.config['QR_LOTE_MAXIMO']
+                if duracion > presupuesto:
+                    current_app.logger.warning(
+                        f"Lote de {cantidad_qr} QRs tardó {duracion:.1f}s (presupuesto proporcional: {presupuesto:.1f}s)"
+                    )
                 
                 flash(f"¡Éxito! Se generaron y registraron {qrs_generados_exitosamente} QRs. El PDF está descargando.", "success")
                 
-                return send_file(pdf_buffer, 
+                return send_file(archivo, 
                                  as_attachment=True, 
-                                 download_name=f"QRs_Lote_{numero_campana}_{datetime.now().strftime('%Y%m%d')}.pdf", 
-                                 mimetype='application/pdf')
+                                 download_name=download_name, 
+                                 mimetype=mimetype)
             
             else:
                 flash("Error al generar los QRs. No se insertó ninguno en la base de datos.", "danger")
@@ -523,6 +462,217 @@ def consultar_campana(numero_campana):
         return jsonify({'exists': False, 'data': None, 'error': 'Error interno de consulta'}), 500
 
 
+# --- RUTA API de tendencias (series diarias/semanales) ---
+
+TENDENCIAS_DIAS_DEFECTO = 90
+TENDENCIAS_DIAS_MAXIMO = 732 # Dos años
+
+
+@doctor_bp.route('/api/tendencias', methods=['GET'])
+@doctor_login_required
+def api_tendencias():
+    """
+    Serie de registros, resultados y positividad por día o semana.
+    Parámetros: campana_id (opcional), desde/hasta (AAAA-MM-DD; por defecto los últimos 90 días),
+    intervalo ('dia' o 'semana'). Se lee de resumen_diario: no recorre la tabla paciente.
+    """
+    campana_id = request.args.get('campana_id') or None
+    intervalo = request.args.get('intervalo', 'dia')
+    if intervalo not in ('dia', 'semana'):
+        return jsonify({'error': "intervalo debe ser 'dia' o 'semana'"}), 400
+
+    try:
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() if request.args.get('hasta') else datetime.now().date()
+        desde = (datetime.strptime(request.args['desde'], '%Y-%m-%d').date() if request.args.get('desde')
+                 else hasta - timedelta(days=TENDENCIAS_DIAS_DEFECTO - 1))
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido, usa AAAA-MM-DD'}), 400
+
+    if desde > hasta:
+        return jsonify({'error': "'desde' debe ser anterior o igual a 'hasta'"}), 400
+    if (hasta - desde).days >= TENDENCIAS_DIAS_MAXIMO:
+        return jsonify({'error': f'El rango máximo es de {TENDENCIAS_DIAS_MAXIMO} días'}), 400
+
+    serie = leer_tendencias(desde, hasta, campana_id, intervalo)
+    if serie is None:
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    return jsonify({
+        'campana_id': campana_id,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'intervalo': intervalo,
+        'serie': serie,
+    }), 200
+
+
+# --- RUTA API de métricas (JSON con ETag para refrescar las gráficas) ---
+
+def _respuesta_cacheable(respuesta, etag):
+    """Marca la respuesta con ETag fuerte: el navegador puede guardarla pero debe revalidar siempre."""
+    respuesta.set_etag(etag)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+@doctor_bp.route('/api/metricas', methods=['GET'])
+@doctor_login_required
+def api_metricas():
+    """
+    Las mismas métricas que reportes.html (campana_id opcional) en JSON. El ETag se deriva de la
+    versión de version_datos, que cambia con cada escritura en los resúmenes: si el cliente envía
+    If-None-Match con el ETag vigente se responde 304 sin leer las métricas.
+    """
+    campana_id = request.args.get('campana_id') or None
+    version = leer_version()
+    if version is None:
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    etag = f"metricas-v{version}-{campana_id or 'todas'}"
+    if request.if_none_match.contains(etag):
+        return _respuesta_cacheable(Response(status=304), etag)
+
+    resumen = leer_resumen(campana_id)
+    if resumen is None:
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    respuesta = jsonify({
+        'campana_id': campana_id,
+        'version': version,
+        'metricas': formatear_metricas(resumen),
+    })
+    return _respuesta_cacheable(respuesta, etag)
+
+
+# --- RUTA API de comparación de campañas ---
+
+COMPARACION_MAX_CAMPANAS = 50
+
+
+@doctor_bp.route('/api/comparar_campanas', methods=['GET'])
+@doctor_login_required
+def api_comparar_campanas():
+    """
+    Métricas lado a lado de varias campañas: ?campanas=1,2,3 (o ?campanas=1&campanas=2).
+    Todas salen de una sola consulta agrupada sobre resumen_campana, así que el tiempo de
+    respuesta no crece con el número de campañas ni de pacientes.
+    """
+    campanas = []
+    for valor in request.args.getlist('campanas'):
+        for campana in valor.split(','):
+            campana = campana.strip()
+            if campana and campana not in campanas:
+                campanas.append(campana)
+
+    if not campanas:
+        return jsonify({'error': 'Indica al menos una campaña en el parámetro campanas'}), 400
+    if len(campanas) > COMPARACION_MAX_CAMPANAS:
+        return jsonify({'error': f'Se pueden comparar como máximo {COMPARACION_MAX_CAMPANAS} campañas'}), 400
+
+    resumenes = leer_resumenes(campanas)
+    if resumenes is None:
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    return jsonify({
+        'campanas': [dict(formatear_metricas(resumenes[campana]), numero_campana=campana) for campana in campanas],
+    }), 200
+
+
+# --- RUTA API de tablas cruzadas (motor vectorizado de utils/analitica.py) ---
+
+TABLA_CRUZADA_LIMITE = 1000
+
+
+@doctor_bp.route('/api/tabla_cruzada', methods=['GET'])
+@doctor_login_required
+def api_tabla_cruzada():
+    """
+    Tabla cruzada de pacientes por las dimensiones pedidas, p. ej. ?dimensiones=sexo,rango_edad,resultado
+    (campana_id y limite opcionales). Se resuelve en memoria sobre el cubo de arreglos NumPy: un desglose
+    nuevo no requiere otra consulta a la base de datos.
+    """
+    dimensiones = [d.strip() for d in request.args.get('dimensiones', '').split(',') if d.strip()]
+    invalidas = [d for d in dimensiones if d not in DIMENSIONES]
+    if not dimensiones or invalidas or len(set(dimensiones)) != len(dimensiones):
+        return jsonify({'error': f"dimensiones debe ser una lista sin repetir de: {', '.join(DIMENSIONES)}"}), 400
+
+    limite = request.args.get('limite', str(TABLA_CRUZADA_LIMITE))
+    if not limite.isdigit() or not 0 < int(limite) <= TABLA_CRUZADA_LIMITE:
+        return jsonify({'error': f'limite debe estar entre 1 y {TABLA_CRUZADA_LIMITE}'}), 400
+
+    try:
+        cubo = obtener_cubo()
+    except Exception as e:
+        current_app.logger.error(f"Error al cargar el cubo de analítica: {e}")
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    campana_id = request.args.get('campana_id') or None
+    filas, total_grupos = tabla_cruzada(cubo, dimensiones, campana_id, int(limite))
+    return jsonify({
+        'dimensiones': dimensiones,
+        'campana_id': campana_id,
+        'total_grupos': total_grupos,
+        'filas': filas,
+    }), 200
+
+
+# --- RUTA API del desglose geográfico (estado > municipio > colonia) ---
+
+def _parametros_geograficos():
+    """Lee nivel/padre_id de la URL. Devuelve (nivel, padre_id, error)."""
+    nivel = request.args.get('nivel', 'estado')
+    if nivel not in NIVELES_GEOGRAFICOS:
+        return None, None, f"nivel debe ser uno de: {', '.join(NIVELES_GEOGRAFICOS)}"
+    padre_id = request.args.get('padre_id')
+    if nivel == 'estado':
+        return nivel, None, None
+    if not padre_id or not padre_id.isdigit():
+        return None, None, f"padre_id (id del {'estado' if nivel == 'municipio' else 'municipio'}) es obligatorio para el nivel '{nivel}'"
+    return nivel, int(padre_id), None
+
+
+@doctor_bp.route('/api/geografico', methods=['GET'])
+@doctor_login_required
+def api_geografico():
+    """
+    Pruebas, positivos, positividad y tasa de vinculación por área, con drill-down:
+    ?nivel=estado -> ?nivel=municipio&padre_id=<estado> -> ?nivel=colonia&padre_id=<municipio>
+    (campana_id opcional). Se lee del cubo pre-agregado resumen_geografico.
+    """
+    nivel, padre_id, error = _parametros_geograficos()
+    if error:
+        return jsonify({'error': error}), 400
+
+    campana_id = request.args.get('campana_id') or None
+    areas = leer_geografico(nivel, padre_id, campana_id)
+    if areas is None:
+        return jsonify({'error': 'Error interno de consulta'}), 500
+
+    return jsonify({
+        'nivel': nivel,
+        'padre_id': padre_id,
+        'campana_id': campana_id,
+        'areas': areas,
+    }), 200
+
+
+# --- RUTA API de monitoreo de la base de datos ---
+
+@doctor_bp.route('/api/estadisticas_db', methods=['GET'])
+@doctor_login_required
+def estadisticas_db():
+    """Estadísticas del proceso actual: consultas/latencia por endpoint y estado de los pools de conexiones."""
+    return jsonify({
+        'endpoints': get_endpoint_stats(),
+        'pool': get_pool_stats(),
+        'pool_replica': get_replica_stats(),
+        'cache_kpis': get_kpi_cache_stats(),
+        'cache_reportes': get_reportes_cache_stats(),
+        'cache_qr': get_qr_cache_stats(),
+    }), 200
+
+
 # --- OTRAS RUTAS (PDFs) ---
 
 
@@ -532,8 +682,8 @@ def descargar_reporte_pdf():
     # Obtener el filtro de la URL
     campana_id = request.args.get('campana_id')
     
-    # Llamar a la función de métricas con el filtro
-    metricas = calcular_metricas_reporte(campana_id)
+    # Llamar a la función de métricas con el filtro (mismo cache que la página de reportes)
+    metricas, _, _ = obtener_reporte_cacheado(campana_id)
 
     if not metricas or metricas.get('total_evaluaciones', 0) == 0:
         flash("No hay datos de evaluaciones completadas para generar el reporte PDF.", "warning")
@@ -708,6 +858,45 @@ def descargar_reporte_pdf():
                     y_position = height - 50
                     c.setFont("Helvetica", 10)
         
+        # --- SECCIÓN 5: DESGLOSE GEOGRÁFICO (cubo resumen_geografico) ---
+        nivel_geo, padre_geo, error_geo = _parametros_geograficos()
+        areas = leer_geografico(nivel_geo, padre_geo, campana_id) if not error_geo else None
+        if areas:
+            if y_position < 150:
+                c.showPage()
+                y_position = height - 50
+            y_position -= 20
+
+            c.setFillColorRGB(0.4, 0.2, 0.6)
+            c.rect(50, y_position - 15, width - 100, 20, fill=1)
+            c.setFillColorRGB(1, 1, 1)
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(60, y_position - 10, f"5. Desglose Geográfico (por {nivel_geo})")
+            y_position -= 30
+            c.setFillColorRGB(0, 0, 0)
+
+            columnas = [("Área", 60), ("Generados", 250), ("Vinculación", 320), ("Pruebas", 400), ("Positivos", 455), ("Positividad", 510)]
+
+            def encabezado_tabla(y):
+                c.setFont("Helvetica-Bold", 9)
+                for titulo, x in columnas:
+                    c.drawString(x, y, titulo)
+                c.setFont("Helvetica", 9)
+                return y - 15
+
+            y_position = encabezado_tabla(y_position)
+            for area in areas:
+                if y_position < 50:
+                    c.showPage()
+                    y_position = encabezado_tabla(height - 50)
+                valores = [
+                    str(area['nombre'])[:38], str(area['generados']), f"{area['tasa_vinculacion']:.1f}%",
+                    str(area['evaluaciones']), str(area['positivos']), f"{area['tasa_positividad']:.1f}%",
+                ]
+                for (_, x), valor in zip(columnas, valores):
+                    c.drawString(x, y_position, valor)
+                y_position -= 13
+
         # Finalizar el PDF
         c.showPage()
         c.save()
@@ -727,13 +916,55 @@ def descargar_reporte_pdf():
         return redirect(url_for('doctor_bp.reportes', campana_id=campana_id))
 
 
+# --- RUTA DE EXPORTACIÓN DE DATOS A NIVEL PACIENTE (CSV / NDJSON / Parquet / Arrow en streaming) ---
+
+@doctor_bp.route('/exportar_pacientes', methods=['GET'])
+@doctor_login_required
+def exportar_pacientes():
+    """
+    Descarga una fila por paciente vinculado (demografía, resultado, QR, campaña y ubicación).
+    Parámetros: formato ('csv', 'ndjson', 'parquet' o 'arrow'), gzip=1 (opcional, solo formatos de texto),
+    campana_id, desde/hasta (AAAA-MM-DD, sobre fecha_registro). La respuesta se genera en streaming
+    desde un cursor sin buffer.
+    """
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({'error': f"formato debe ser uno de: {', '.join(FORMATOS_EXPORTACION)}"}), 400
+    if formato in FORMATOS_COLUMNARES and not arrow_disponible():
+        # Se valida antes de empezar el streaming: después ya no se puede responder con un error
+        return jsonify({'error': f"El formato '{formato}' requiere pyarrow instalado en el servidor"}), 501
+
+    try:
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date() if request.args.get('desde') else None
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() if request.args.get('hasta') else None
+    except ValueError:
+        return jsonify({'error': 'Formato de fecha inválido, usa AAAA-MM-DD'}), 400
+    if desde and hasta and desde > hasta:
+        return jsonify({'error': "'desde' debe ser anterior o igual a 'hasta'"}), 400
+
+    campana_id = request.args.get('campana_id') or None
+    generador, mimetype, extension, admite_gzip = FORMATOS_EXPORTACION[formato]
+    contenido = generador(leer_filas(campana_id, desde, hasta))
+
+    download_name = f"Pacientes_{campana_id or 'Todas'}_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    if request.args.get('gzip') == '1' and admite_gzip:
+        contenido = comprimir_gzip(contenido)
+        mimetype = 'application/gzip'
+        download_name += '.gz'
+
+    respuesta = Response(stream_with_context(contenido), mimetype=mimetype)
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    respuesta.headers['X-Accel-Buffering'] = 'no' # Que el proxy no acumule la respuesta completa
+    return respuesta
+
+
 @doctor_bp.route('/descargar_qr/<string:codigo_qr>', methods=['GET'])
 @doctor_login_required 
 def descargar_qr(codigo_qr):
 
     # NOTA: Se actualiza el SELECT para obtener codigo_postal
     query = "SELECT codigo, numero_campana, codigo_postal, id_colonia FROM qr WHERE codigo = %s"
-    qr_data = execute_query(query, (codigo_qr,), fetch_one=True)
+    qr_data = execute_query(query, (codigo_qr,), fetch_one=True, prepared=True)
     
     if not qr_data:
         flash("Error: El código QR solicitado no existe.", "danger")
@@ -754,10 +985,7 @@ def descargar_qr(codigo_qr):
         c.drawString(50, height - 130, f"CP: {qr_data['codigo_postal']} (Colonia ID: {qr_data.get('id_colonia', 'N/D')})") 
         
 
-        qr_img = qrcode.make(url_para_qr)
-        img_buffer = BytesIO(); qr_img.save(img_buffer, "PNG"); img_buffer.seek(0)
-        qr_image_reader = ImageReader(img_buffer)
-        c.drawImage(qr_image_reader, (width - 200) / 2.0, height - 400, width=200, height=200)
+        dibujar_qr(c, render_qr(url_para_qr), (width - 200) / 2.0, height - 400, 200)
 
         c.showPage(); c.save(); pdf_buffer.seek(0)
         
@@ -1,10 +1,11 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request, current_app
-from database.connection import execute_query 
-from datetime import datetime, timedelta 
+from flask import Blueprint, render_template, stream_template, session, Response, redirect, url_for, flash, request, current_app
+from database.connection import execute_query, iter_query, transaction 
+from utils.kpis import obtener_kpis, invalidar_kpis 
+from utils.metricas import registrar_vinculacion, invalidar_reportes 
+from datetime import datetime 
 from functools import wraps 
-import qrcode
-import base64
-from io import BytesIO
+from qrcode.constants import ERROR_CORRECT_L
+from utils.qr_manager import render_qr
 import json
 from decimal import Decimal
 
@@ -30,29 +31,6 @@ def enfermero_login_required(f):
 enfermero_bp = Blueprint('enfermero_bp', __name__, url_prefix='/enfermero')
 
 
-def generar_qr_base64(data_qr):
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=4,
-            border=2,
-        )
-        qr.add_data(data_qr)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Guardar en un buffer de memoria
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        
-        # Codificar a Base y agregar el prefijo de datos
-        return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
-    except Exception as e:
-        current_app.logger.error(f"Error al generar QR Base64 para data '{data_qr}': {e}")
-        return None 
-
-
 # --- FUNCIÓN AUXILIAR PARA CARGAR DATOS DE UBICACIÓN (NUEVA) ---
 
 def cargar_datos_ubicacion_enfermero():
@@ -82,31 +60,11 @@ def cargar_datos_ubicacion_enfermero():
 @enfermero_bp.route('/dashboard')
 @enfermero_login_required 
 def dashboard():
-    qrs_pendientes = 0
-    pacientes_registrados = 0
-    nuevos_registros = 0
     qrs_pendientes_tabla = []
 
     try:
-        # a) QRs Pendientes
-        query_qrs_pendientes = "SELECT COUNT(id) AS total FROM qr WHERE estado = 'Generado' AND paciente_id IS NULL"
-        pendientes_data = execute_query(query_qrs_pendientes, fetch_one=True)
-        if pendientes_data: qrs_pendientes = pendientes_data.get('total', 0)
-            
-        # b) Pacientes Registrados (QRs Vinculados)
-        query_pacientes_registrados = "SELECT COUNT(id) AS total FROM qr WHERE estado = 'Vinculado'"
-        registrados_data = execute_query(query_pacientes_registrados, fetch_one=True)
-        if registrados_data: pacientes_registrados = registrados_data.get('total', 0)
-        
-        # c) Nuevos Registros (Últimas 24 horas)
-        try:
-            fecha_limite = (datetime.now() - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
-            query_nuevos_registros = "SELECT COUNT(id) AS total FROM paciente WHERE fecha_registro >= %s"
-            nuevos_data = execute_query(query_nuevos_registros, (fecha_limite,), fetch_one=True)
-            if nuevos_data: nuevos_registros = nuevos_data.get('total', 0)
-        except Exception as e_specific:
-            nuevos_registros = 0
-            current_app.logger.warning(f"Error al contar 'Nuevos Registros': {e_specific}. Se mostrará 0.")
+        # QRs pendientes, pacientes registrados y nuevos registros (24 h): una sola consulta agregada, cacheada
+        kpis = obtener_kpis()
 
         # CONSULTA PARA LA TABLA INFERIOR
         query_tabla_pendientes = """
@@ -124,49 +82,84 @@ def dashboard():
         return redirect(url_for('auth_bp.login'))
 
     return render_template('enfermero/dashboard.html',
-                           qrs_pendientes=qrs_pendientes,
-                           pacientes_registrados=pacientes_registrados,
-                           nuevos_registros=nuevos_registros,
+                           qrs_pendientes=kpis['qrs_pendientes'],
+                           pacientes_registrados=kpis['pacientes_registrados'],
+                           nuevos_registros=kpis['nuevos_registros'],
                            qrs_pendientes_tabla=qrs_pendientes_tabla)
 
 
 # --- 2. INICIO DE VINCULACIÓN (Mantiene protección de sesión) ---
 
+# QRs pendientes por página, del más reciente al más antiguo; (fecha_entrega, id) es la llave de
+# paginación: cada página continúa donde terminó la anterior (ix_qr_estado_paciente_fecha) sin OFFSET
+QUERY_QRS_PENDIENTES = """
+SELECT id, codigo, fecha_entrega
+FROM qr
+WHERE estado = 'Generado' AND paciente_id IS NULL {despues}
+ORDER BY fecha_entrega DESC, id DESC
+LIMIT %s
+"""
+
+
+def _leer_cursor(texto):
+    """'AAAA-MM-DD.id' -> (fecha, id); None si falta o no es válido (se muestra la primera página)."""
+    try:
+        fecha, qr_id = (texto or '').split('.')
+        return datetime.strptime(fecha, '%Y-%m-%d').date(), int(qr_id)
+    except ValueError:
+        return None
+
+
 @enfermero_bp.route('/vincular_inicio')
 @enfermero_login_required 
 def vincular_inicio():
-    # 1. Consulta la Base de Datos para QRs pendientes
-    query_qrs_pendientes = """
-    SELECT codigo 
-    FROM qr 
-    WHERE estado = 'Generado' AND paciente_id IS NULL 
-    ORDER BY fecha_entrega DESC
     """
+    Galería de QRs pendientes, paginada por llave: el costo de cada página no depende de cuántos
+    QRs pendientes haya. Las imágenes se piden aparte (imagen_qr), cacheables y con carga diferida.
+    """
+    por_pagina = current_app.config.get('QR_PENDIENTES_POR_PAGINA', 60)
+    cursor = _leer_cursor(request.args.get('despues'))
+
+    despues, params = '', (por_pagina + 1,) # Una fila extra indica si hay página siguiente
+    if cursor:
+        despues = "AND (fecha_entrega < %s OR (fecha_entrega = %s AND id < %s))"
+        params = (cursor[0], cursor[0], cursor[1], por_pagina + 1)
+    qrs_pendientes = execute_query(QUERY_QRS_PENDIENTES.format(despues=despues), params, prepared=True) or []
+
+    siguiente = None
+    if len(qrs_pendientes) > por_pagina:
+        qrs_pendientes = qrs_pendientes[:por_pagina]
+        ultimo = qrs_pendientes[-1]
+        siguiente = f"{ultimo['fecha_entrega']:%Y-%m-%d}.{ultimo['id']}"
+
+    return render_template('enfermero/vincular_inicio.html',
+                           qrs_pendientes=qrs_pendientes,
+                           siguiente=siguiente,
+                           es_primera_pagina=cursor is None)
+
+
+@enfermero_bp.route('/qr/<codigo>.<any(png, svg):formato>')
+@enfermero_login_required
+def imagen_qr(codigo, formato):
+    """
+    Imagen del QR de acceso de un código (PNG o SVG), desde el cache compartido de utils/qr_manager.
+    La imagen de un código no cambia nunca: el navegador la guarda un año sin revalidar.
+    """
+    if not execute_query("SELECT id FROM qr WHERE codigo = %s", (codigo,), fetch_one=True, prepared=True):
+        return Response(status=404)
+
+    url_para_qr = url_for('paciente_bp.acceso_qr', qr_codigo=codigo, _external=True)
     try:
-        qrs_desde_db = execute_query(query_qrs_pendientes) or []
+        contenido = render_qr(url_para_qr, formato, box_size=4, border=2, error_correction=ERROR_CORRECT_L)
     except Exception as e:
-        current_app.logger.error(f"Error al consultar QRs pendientes para vinculación: {e}")
-        flash("Error al cargar la lista de códigos QR. Intente más tarde.", "danger")
-        qrs_desde_db = []
-    
-    qrs_listos = []
-    
-    # 2. Procesamiento: Generar la imagen QR en Base64 para el template
-    for qr in qrs_desde_db:
-        codigo = qr.get('codigo')
-        
-        url_para_qr = url_for('paciente_bp.acceso_qr', qr_codigo=codigo, _external=True) 
-        
-        imagen_base64 = generar_qr_base64(url_para_qr)
-        
-        if imagen_base64:
-            qrs_listos.append({
-                'codigo': codigo,
-                'imagen_base64': imagen_base64
-            })
+        current_app.logger.error(f"Error al generar la imagen QR de '{codigo}': {e}")
+        return Response(status=500)
 
-    # 3. Renderizar la Plantilla
-    return render_template('enfermero/vincular_inicio.html', qrs_pendientes=qrs_listos)
+    respuesta = Response(contenido, mimetype='image/png' if formato == 'png' else 'image/svg+xml')
+    respuesta.cache_control.private = True # Requiere sesión: no se guarda en caches compartidos
+    respuesta.cache_control.max_age = 365 * 24 * 3600
+    respuesta.cache_control.immutable = True
+    return respuesta
 
 
 
@@ -190,7 +183,7 @@ def vincular_con_codigo(codigo):
 
     # 1. Verificar el QR (Validaciones)
     query_qr = "SELECT id, estado, paciente_id FROM qr WHERE codigo = %s"
-    qr_data = execute_query(query_qr, (codigo,), fetch_one=True)
+    qr_data = execute_query(query_qr, (codigo,), fetch_one=True, prepared=True)
 
     if not qr_data:
         flash(f"Error: El código QR '{codigo}' no existe. No es posible continuar con el registro.", "danger")
@@ -263,26 +256,27 @@ def vincular_con_codigo(codigo):
                          id_estado, id_municipio, id_colonia, codigo_postal, 
                          resultado, fecha_registro)
         
+        # 2. ACTUALIZAR QR (solo si sigue libre, para evitar una doble vinculación concurrente)
+        query_update_qr = "UPDATE qr SET estado = 'Vinculado', paciente_id = %s WHERE codigo = %s AND paciente_id IS NULL" 
+        
+        # Ambas sentencias van en una sola transacción: o se registra y vincula, o no queda nada.
         try:
-            paciente_id = execute_query(query_insert_paciente, paciente_data, commit=True)
-            if paciente_id: paciente_id = int(paciente_id)
-        except Exception as e_insert:
-            current_app.logger.error(f"Error al insertar paciente: {e_insert}")
-            flash(f"Error CRÍTICO: Falló el registro del paciente. Verifique la estructura de su tabla 'paciente'. Detalle: {e_insert}", "danger")
+            with transaction():
+                paciente_id = int(execute_query(query_insert_paciente, paciente_data, commit=True))
+                if not execute_query(query_update_qr, (paciente_id, codigo), commit=True):
+                    raise ValueError(f"El código QR '{codigo}' ya fue vinculado a otro paciente.")
+                registrar_vinculacion(codigo)
+            invalidar_kpis()
+            invalidar_reportes()
+            flash(f"Paciente {nombre} {apellido_paterno} registrado y vinculado exitosamente.", "success")
+        
+        except Exception as e_registro:
+            current_app.logger.error(f"Error al registrar y vincular paciente (revertido): {e_registro}")
+            flash(f"Error CRÍTICO: Falló el registro del paciente; no se guardó ningún cambio. Detalle: {e_registro}", "danger")
             estados_data, municipios_data, colonias_data = cargar_datos_ubicacion_enfermero()
             return render_template('enfermero/registrar_paciente.html', codigo_qr=codigo, form_data=request.form,
                                    estados=estados_data, municipios=municipios_data, colonias=colonias_data)
             
-        # 2. ACTUALIZAR QR
-        query_update_qr = "UPDATE qr SET estado = 'Vinculado', paciente_id = %s WHERE codigo = %s" 
-        try:
-            execute_query(query_update_qr, (paciente_id, codigo), commit=True)
-            flash(f"Paciente {nombre} {apellido_paterno} registrado y vinculado exitosamente.", "success")
-        
-        except Exception as e_update:
-            current_app.logger.error(f"Error de DB al actualizar QR. Error: {e_update}")
-            flash(f"Paciente registrado. **ADVERTENCIA CRÍTICA**: Falló la vinculación del QR. Contacte a soporte.", "danger")
-            
         
         # 3. Redirigir a la página de confirmación.
         return redirect(url_for('enfermero_bp.confirmacion_qr', qr_codigo=codigo, paciente_id=paciente_id))
@@ -350,14 +344,28 @@ def pacientes():
     ORDER BY p.id DESC
     """
 
+    # La lista se envía en streaming: memoria constante sin importar cuántos pacientes haya.
+    # La primera fila se lee antes de empezar la respuesta: si la consulta falla todavía se puede
+    # mostrar el aviso (flash) y una lista vacía.
+    filas = iter_query(query)
     try:
-        pacientes_registrados = execute_query(query) 
-        pacientes_registrados = pacientes_registrados or []
-            
+        primera = next(filas, None)
     except Exception as e:
         current_app.logger.error(f"Error al cargar la lista de pacientes: {e}")
         flash(f"Error al cargar la lista de pacientes: {e}", "danger") 
-        pacientes_registrados = []
+        primera = None
 
-    return render_template('enfermero/pacientes.html', 
-                            pacientes=pacientes_registrados)
\ No newline at end of file
+    def pacientes_registrados():
+        try:
+            if primera is None:
+                return
+            yield primera
+            yield from filas
+        except Exception as e:
+            # La página ya se está enviando: solo se registra el error y la lista queda truncada
+            current_app.logger.error(f"Error al recorrer la lista de pacientes: {e}")
+        finally:
+            filas.close() # Devuelve la conexión al pool aunque el cliente corte la descarga
+
+    return stream_template('enfermero/pacientes.html', 
+                            pacientes=pacientes_registrados())
\ No newline at end of file
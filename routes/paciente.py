@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, current_app
-from database.connection import execute_query 
+from database.connection import execute_query, transaction 
+from utils.kpis import invalidar_kpis 
+from utils.metricas import registrar_resultado, invalidar_reportes 
 from datetime import datetime
 
 paciente_bp = Blueprint('paciente_bp', __name__, url_prefix='/paciente')
@@ -24,7 +26,7 @@ def acceso_qr(qr_codigo):
     LEFT JOIN paciente p ON q.paciente_id = p.id
     WHERE q.codigo = %s
     """
-    qr_data = execute_query(query_qr, (qr_codigo,), fetch_one=True)
+    qr_data = execute_query(query_qr, (qr_codigo,), fetch_one=True, prepared=True)
 
     if not qr_data:
         flash("Código QR no válido. Contacte al personal de enfermería.", "danger")
@@ -164,8 +166,12 @@ def guardar_resultado():
 
     try:
         # 1. ACTUALIZACIÓN CORREGIDA: Solo actualiza la columna 'resultado'
-        query_update = "UPDATE paciente SET resultado = %s WHERE id = %s"
-        execute_query(query_update, (resultado, paciente_id), commit=True)
+        #    junto con el resumen de métricas de su campaña, en la misma transacción
+        with transaction():
+            actualizadas = registrar_resultado(paciente_id, resultado)
+        if actualizadas:
+            invalidar_kpis()
+            invalidar_reportes()
         
         # 2. Limpiar la sesión inmediatamente
         session.clear() 
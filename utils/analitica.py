@@ -0,0 +1,172 @@
+"""
+Motor de tablas cruzadas sobre los pacientes vinculados.
+
+Las columnas necesarias se leen UNA vez (iter_query, en streaming) y se guardan como arreglos NumPy
+compactos de códigos enteros por dimensión. Cualquier combinación de dimensiones se resuelve en
+memoria con un group-by vectorizado (np.unique + np.bincount), sin una consulta SQL por desglose.
+
+El cubo vive en el cache de reportes (stale-while-revalidate): después de una escritura se sirve el
+cubo anterior y se recarga en segundo plano, igual que las métricas de reportes.html.
+
+Para agregar una dimensión: leer su columna en _QUERY_CUBO, codificarla en cargar_cubo() y
+registrarla en DIMENSIONES.
+"""
+import numpy as np
+
+from database.connection import execute_query, iter_query
+from utils.metricas import RANGOS_EDAD, RANGO_NO_ESPECIFICADO, SIN_AREA, clasificar_sexo, obtener_cacheado
+
+DIMENSIONES = ('sexo', 'rango_edad', 'resultado', 'estado', 'municipio', 'campana')
+
+_QUERY_CUBO = """
+SELECT q.numero_campana, p.sexo, p.edad, p.resultado, p.id_estado, p.id_municipio
+FROM paciente p
+JOIN qr q ON q.paciente_id = p.id
+"""
+
+_SEXOS = ['H', 'M', 'O']
+_RESULTADOS = ['Positivo', 'Negativo', None] # None: sin resultado capturado
+_LIMITES_EDAD = np.array([limite for limite, _ in RANGOS_EDAD if limite is not None])
+_RANGOS = [etiqueta for _, etiqueta in RANGOS_EDAD] + [RANGO_NO_ESPECIFICADO, None] # None: edad no capturada
+
+BLOQUE_CARGA = 50000 # Filas que se convierten a arreglos a la vez
+
+
+class Cubo:
+    """Columnas codificadas: codigos[dim] es un arreglo entero y etiquetas[dim][codigo] su valor."""
+
+    def __init__(self, codigos, etiquetas, nombres):
+        self.codigos = codigos
+        self.etiquetas = etiquetas
+        self.nombres = nombres # {dim: {id: nombre}} para estado y municipio
+        self.total = len(codigos['sexo'])
+        self.evaluado = codigos['resultado'] != _RESULTADOS.index(None)
+        self.positivo = codigos['resultado'] == _RESULTADOS.index('Positivo')
+
+
+def _factorizar(valores, indices, dtype=np.int32):
+    """Códigos de `valores` según `indices` ({valor: código}), que se amplía con los valores nuevos."""
+    return np.fromiter((indices.setdefault(v, len(indices)) for v in valores), dtype=dtype, count=len(valores))
+
+
+def _codificar_edad(edades):
+    edad = np.array(edades, dtype=np.float64) # None -> nan
+    codigos = np.searchsorted(_LIMITES_EDAD, edad, side='left').astype(np.int8)
+    codigos[edad < 0] = _RANGOS.index(RANGO_NO_ESPECIFICADO)
+    codigos[np.isnan(edad)] = _RANGOS.index(None)
+    return codigos
+
+
+def _nombres_catalogo(tabla, ids):
+    ids = [i for i in ids if i != SIN_AREA]
+    if not ids:
+        return {}
+    marcadores = ', '.join(['%s'] * len(ids))
+    filas = execute_query(f"SELECT id, nombre FROM {tabla} WHERE id IN ({marcadores})", tuple(ids))
+    return {fila['id']: fila['nombre'] for fila in (filas or [])}
+
+
+def _bloques(filas, tamano=BLOQUE_CARGA):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) == tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def cargar_cubo():
+    """
+    Lee las columnas de todos los pacientes vinculados y las codifica en una sola pasada. Las filas
+    se convierten a arreglos por bloques: solo un bloque vive a la vez como objetos de Python.
+    """
+    campanas, sexos = {}, {}
+    mapa_resultado = {r: i for i, r in enumerate(_RESULTADOS)}
+    partes = {dim: [] for dim in ('campana', 'sexo', 'rango_edad', 'resultado', 'estado', 'municipio')}
+
+    for bloque in _bloques(iter_query(_QUERY_CUBO)):
+        partes['campana'].append(_factorizar([f['numero_campana'] for f in bloque], campanas))
+        partes['sexo'].append(_factorizar([f['sexo'] for f in bloque], sexos))
+        partes['rango_edad'].append(_codificar_edad([f['edad'] for f in bloque]))
+        partes['resultado'].append(np.fromiter(
+            (mapa_resultado.get(f['resultado'], mapa_resultado[None]) for f in bloque), dtype=np.int8, count=len(bloque)
+        ))
+        partes['estado'].append(np.fromiter((f['id_estado'] or SIN_AREA for f in bloque), dtype=np.int32, count=len(bloque)))
+        partes['municipio'].append(np.fromiter((f['id_municipio'] or SIN_AREA for f in bloque), dtype=np.int32, count=len(bloque)))
+
+    columnas = {
+        dim: np.concatenate(arreglos) if arreglos else np.zeros(0, dtype=np.int32)
+        for dim, arreglos in partes.items()
+    }
+    codigos = {'campana': columnas['campana'], 'rango_edad': columnas['rango_edad'], 'resultado': columnas['resultado']}
+    etiquetas = {'campana': list(campanas), 'rango_edad': _RANGOS, 'resultado': _RESULTADOS, 'sexo': _SEXOS}
+
+    # El sexo capturado tiene pocas variantes: se clasifica cada variante una vez y se traduce por índice
+    traduccion = np.array([_SEXOS.index(clasificar_sexo(v)) for v in sexos], dtype=np.int8)
+    codigos['sexo'] = traduccion[columnas['sexo']] if len(sexos) else columnas['sexo'].astype(np.int8)
+
+    nombres = {}
+    for dim, tabla in (('estado', 'estados'), ('municipio', 'municipios')):
+        ids, inverso = np.unique(columnas[dim], return_inverse=True)
+        codigos[dim] = inverso.astype(np.int32)
+        etiquetas[dim] = [int(i) for i in ids]
+        nombres[dim] = _nombres_catalogo(tabla, etiquetas[dim])
+
+    return Cubo(codigos, etiquetas, nombres)
+
+
+def obtener_cubo():
+    """Cubo desde el cache de reportes; lanza excepción si no se pudo cargar."""
+    cubo, _ = obtener_cacheado(('analitica',), cargar_cubo)
+    return cubo
+
+
+def _etiqueta(cubo, dim, codigo):
+    valor = cubo.etiquetas[dim][codigo]
+    if dim in cubo.nombres:
+        return {'id': valor, 'nombre': cubo.nombres[dim].get(valor, 'Sin ubicación' if valor == SIN_AREA else str(valor))}
+    return valor
+
+
+def tabla_cruzada(cubo, dimensiones, numero_campana=None, limite=None):
+    """
+    Pacientes, evaluaciones, positivos y positividad por cada combinación de `dimensiones`
+    (subconjunto ordenado de DIMENSIONES), opcionalmente solo de una campaña.
+    Devuelve (filas ordenadas de mayor a menor número de pacientes, total de grupos).
+    """
+    seleccion = np.ones(cubo.total, dtype=bool)
+    if numero_campana:
+        if numero_campana not in cubo.etiquetas['campana']:
+            return [], 0
+        seleccion &= cubo.codigos['campana'] == cubo.etiquetas['campana'].index(numero_campana)
+
+    # Clave única por combinación: índice en el producto cartesiano de las cardinalidades
+    cardinalidades = [len(cubo.etiquetas[dim]) for dim in dimensiones]
+    claves = np.ravel_multi_index(
+        [cubo.codigos[dim][seleccion].astype(np.int64) for dim in dimensiones], cardinalidades
+    ) if dimensiones else np.zeros(int(seleccion.sum()), dtype=np.int64)
+    grupos, inverso = np.unique(claves, return_inverse=True)
+
+    pacientes = np.bincount(inverso, minlength=len(grupos))
+    evaluaciones = np.bincount(inverso, weights=cubo.evaluado[seleccion], minlength=len(grupos)).astype(np.int64)
+    positivos = np.bincount(inverso, weights=cubo.positivo[seleccion], minlength=len(grupos)).astype(np.int64)
+
+    orden = np.argsort(-pacientes, kind='stable')
+    if limite:
+        orden = orden[:limite]
+    codigos_grupo = np.unravel_index(grupos[orden], cardinalidades) if dimensiones else []
+
+    filas = []
+    for posicion, indice in enumerate(orden):
+        fila = {dim: _etiqueta(cubo, dim, int(codigos_grupo[d][posicion])) for d, dim in enumerate(dimensiones)}
+        evaluadas = int(evaluaciones[indice])
+        fila.update({
+            'pacientes': int(pacientes[indice]),
+            'evaluaciones': evaluadas,
+            'positivos': int(positivos[indice]),
+            'tasa_positividad': round(float(positivos[indice]) / evaluadas * 100, 1) if evaluadas else 0.0,
+        })
+        filas.append(fila)
+    return filas, len(grupos)
@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache en memoria del proceso con tiempo de vida (TTL) por entrada.
+    Si varias solicitudes piden la misma clave vencida a la vez, solo una la recalcula;
+    las demás esperan y reutilizan el resultado. Un cálculo que empezó antes de invalidate()
+    no se guarda (contador de generación): leyó datos anteriores a la escritura.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}          # clave -> (valor, expira_en)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._generation = 0     # Se incrementa con invalidate() de todo el cache
+        self._key_generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _get_fresh(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] > time.monotonic():
+            return item
+        return None
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Devuelve el valor cacheado de `key` o lo calcula con `loader()` (los valores falsos no se cachean)."""
+        item = self._get_fresh(key)
+        if item is not None:
+            self.hits += 1
+            return item[0]
+
+        with self._key_lock(key):
+            # Otro hilo pudo haberlo calculado mientras esperábamos
+            item = self._get_fresh(key)
+            if item is not None:
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            generation = self._generation_of(key)
+            value = loader()
+            if value:
+                with self._lock:
+                    if self._generation_of(key) == generation:
+                        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            return value
+
+    def _generation_of(self, key):
+        return self._generation, self._key_generations.get(key, 0)
+
+    def invalidate(self, key=None):
+        """Elimina una clave (o todo el cache si no se indica); los cálculos en curso no se guardan."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                self._generation += 1
+            else:
+                self._data.pop(key, None)
+                self._key_generations[key] = self._key_generations.get(key, 0) + 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+        }
+
+
+class SWRCache:
+    """
+    Cache "stale-while-revalidate" en memoria del proceso.
+    - La primera vez que se pide una clave se calcula en la solicitud (no hay nada que servir).
+    - Después se sirve SIEMPRE el último valor calculado; si es más viejo que `max_age`
+      segundos (o se invalidó), se recalcula en un hilo en segundo plano con su propio
+      contexto de aplicación.
+    - invalidate() marca la clave como vencida. Un recálculo que empezó antes de la
+      invalidación no deja su resultado como vigente (contador de generación).
+    """
+
+    def __init__(self, name='swr'):
+        self.name = name
+        self._data = {}          # clave -> {'value', 'computed_at', 'generation', 'stale'}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def get(self, key, loader, max_age, app):
+        """
+        Devuelve (valor, calculado_en) para `key`. `loader()` se ejecuta dentro de
+        `app.app_context()` cuando el recálculo va en segundo plano.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self.hits += 1
+                vencido = item['stale'] or time.time() - item['computed_at'] > max_age
+                if vencido and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    generation = item['generation']
+                    threading.Thread(
+                        target=self._refresh, args=(key, loader, app, generation),
+                        name=f"{self.name}-refresh", daemon=True,
+                    ).start()
+                return item['value'], item['computed_at']
+            self.misses += 1
+
+        value = loader()
+        computed_at = time.time()
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = {'value': value, 'computed_at': computed_at, 'generation': 0, 'stale': False}
+        return value, computed_at
+
+    def _refresh(self, key, loader, app, generation):
+        try:
+            with app.app_context():
+                value = loader()
+            with self._lock:
+                item = self._data.get(key)
+                if item is not None and item['generation'] == generation:
+                    self._data[key] = {'value': value, 'computed_at': time.time(), 'generation': generation, 'stale': False}
+                    self.refreshes += 1
+        except Exception as e:
+            self.errors += 1
+            app.logger.error(f"Error al recalcular el cache '{self.name}' ({key}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, key=None):
+        """Marca una clave (o todas) como vencida: se sirve una vez más y se recalcula en segundo plano."""
+        with self._lock:
+            items = self._data.values() if key is None else [self._data[key]] if key in self._data else []
+            for item in items:
+                item['stale'] = True
+                item['generation'] += 1
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'refreshing': len(self._refreshing),
+        }
+
+
+class LRUCache:
+    """
+    Cache en memoria del proceso con un máximo de entradas: al llenarse descarta la usada hace más
+    tiempo. Pensado para valores deterministas (el mismo `key` siempre da el mismo valor), así que
+    no vence: si dos hilos calculan la misma clave a la vez, ambos obtienen el mismo resultado.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict() # clave -> valor, de la usada hace más tiempo a la más reciente
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_set(self, key, loader):
+        """Devuelve el valor cacheado de `key` o lo calcula con `loader()` (None no se cachea)."""
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+
+        value = loader() # Fuera del lock: el loader puede a su vez consultar este cache
+        if value is not None and self.max_entries > 0:
+            with self._lock:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, key=None):
+        """Elimina una clave (o todo el cache si no se indica)."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+        }
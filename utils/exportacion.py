@@ -0,0 +1,245 @@
+"""
+Exportación de datos a nivel paciente para análisis (demografía, resultado, QR, campaña y ubicación).
+
+Las filas se leen con iter_query (cursor sin buffer, en bloques de DB_FETCH_SIZE) y se serializan
+a medida que llegan: la memoria no depende del número de filas y el primer byte sale de inmediato.
+No se exportan nombre, apellidos ni teléfono del paciente.
+
+Formatos columnares (Parquet y Arrow IPC) para herramientas de análisis: requieren pyarrow, que se
+importa solo al usarlos. Se escriben por lotes de FILAS_POR_LOTE filas (un row group / record batch
+por lote) y cada lote se envía en cuanto se escribe, así que la memoria también queda acotada.
+"""
+import csv
+import importlib.util
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+from database.connection import iter_query
+
+# Columnas en el orden del archivo
+COLUMNAS_EXPORTACION = [
+    'paciente_id', 'qr_codigo', 'numero_campana', 'fecha_entrega', 'fecha_registro',
+    'sexo', 'edad', 'ocupacion', 'resultado',
+    'id_estado', 'estado', 'id_municipio', 'municipio', 'id_colonia', 'colonia', 'codigo_postal',
+]
+
+_QUERY_EXPORTACION = """
+SELECT
+    p.id AS paciente_id, q.codigo AS qr_codigo, q.numero_campana, q.fecha_entrega, p.fecha_registro,
+    p.sexo, p.edad, p.ocupacion, p.resultado,
+    p.id_estado, e.nombre AS estado, p.id_municipio, m.nombre AS municipio,
+    p.id_colonia, c.nombre AS colonia, p.codigo_postal
+FROM paciente p
+JOIN qr q ON q.paciente_id = p.id
+LEFT JOIN estados e ON e.id = p.id_estado
+LEFT JOIN municipios m ON m.id = p.id_municipio
+LEFT JOIN colonias c ON c.id = p.id_colonia
+"""
+
+TAMANO_BLOQUE = 64 * 1024 # Bytes de texto que se acumulan antes de enviar un bloque
+
+
+def consulta_exportacion(numero_campana=None, desde=None, hasta=None):
+    """
+    (query, params) del export con filtros opcionales: campaña y rango de fecha_registro
+    (`desde`/`hasta` son date, inclusive). Usa ix_qr_campana_paciente / ix_paciente_fecha_registro.
+    """
+    condiciones, params = [], []
+    if numero_campana:
+        condiciones.append("q.numero_campana = %s")
+        params.append(numero_campana)
+    if desde:
+        condiciones.append("p.fecha_registro >= %s")
+        params.append(datetime.combine(desde, datetime.min.time()))
+    if hasta:
+        condiciones.append("p.fecha_registro < %s")
+        params.append(datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+
+    query = _QUERY_EXPORTACION
+    if condiciones:
+        query += "WHERE " + " AND ".join(condiciones)
+    return query, tuple(params)
+
+
+def leer_filas(numero_campana=None, desde=None, hasta=None):
+    """Generador de filas (diccionarios) del export, en streaming."""
+    query, params = consulta_exportacion(numero_campana, desde, hasta)
+    return iter_query(query, params)
+
+
+def _valor(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat(sep=' ') if isinstance(valor, datetime) else valor.isoformat()
+    return valor
+
+
+# --- SERIALIZADORES (generadores de bytes) ---
+
+def _en_bloques(lineas):
+    """Agrupa las líneas de texto en bloques de ~TAMANO_BLOQUE bytes UTF-8."""
+    buffer, tamano = [], 0
+    for linea in lineas:
+        buffer.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, tamano = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def generar_csv(filas):
+    """CSV con encabezado; el encabezado se envía solo, antes de leer la primera fila."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+
+    def linea(valores):
+        escritor.writerow(valores)
+        texto = salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+        return texto
+
+    yield linea(COLUMNAS_EXPORTACION).encode('utf-8')
+    yield from _en_bloques(
+        linea(['' if fila[c] is None else _valor(fila[c]) for c in COLUMNAS_EXPORTACION]) for fila in filas
+    )
+
+
+def generar_ndjson(filas):
+    """Un objeto JSON por línea (NDJSON), con las columnas de COLUMNAS_EXPORTACION."""
+    yield from _en_bloques(
+        json.dumps({c: _valor(fila[c]) for c in COLUMNAS_EXPORTACION}, ensure_ascii=False) + '\n' for fila in filas
+    )
+
+
+def comprimir_gzip(bloques, nivel=6):
+    """Comprime en formato gzip un generador de bytes, también en streaming."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31) # wbits=31: encabezado gzip
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+# --- FORMATOS COLUMNARES (Parquet / Arrow IPC) ---
+
+FILAS_POR_LOTE = 20000
+
+
+def arrow_disponible():
+    """Indica si pyarrow está instalado sin importarlo (importarlo cuesta memoria y tiempo de arranque)."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _esquema_arrow(pa):
+    """Tipos de cada columna: categóricas como diccionario, edad entera y fechas como date/timestamp."""
+    categoria = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('paciente_id', pa.int32()),
+        ('qr_codigo', pa.string()),
+        ('numero_campana', categoria),
+        ('fecha_entrega', pa.date32()),
+        ('fecha_registro', pa.timestamp('s')),
+        ('sexo', categoria),
+        ('edad', pa.int16()),
+        ('ocupacion', pa.string()),
+        ('resultado', categoria),
+        ('id_estado', pa.int32()),
+        ('estado', categoria),
+        ('id_municipio', pa.int32()),
+        ('municipio', categoria),
+        ('id_colonia', pa.int32()),
+        ('colonia', categoria),
+        ('codigo_postal', pa.string()),
+    ])
+
+
+class _SalidaEnBloques:
+    """Destino tipo archivo para los escritores de pyarrow: acumula lo escrito hasta que se drena."""
+
+    def __init__(self):
+        self._bloques = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self._bloques.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drenar(self):
+        datos = b''.join(self._bloques)
+        self._bloques = []
+        return datos
+
+
+def _lotes_arrow(pa, esquema, filas):
+    """RecordBatch de hasta FILAS_POR_LOTE filas, columna por columna."""
+    columnas = {nombre: [] for nombre in esquema.names}
+    total = 0
+    for fila in filas:
+        for nombre, valores in columnas.items():
+            valores.append(fila[nombre])
+        total += 1
+        if total == FILAS_POR_LOTE:
+            yield pa.record_batch([pa.array(columnas[c.name], type=c.type) for c in esquema], schema=esquema)
+            columnas = {nombre: [] for nombre in esquema.names}
+            total = 0
+    if total:
+        yield pa.record_batch([pa.array(columnas[c.name], type=c.type) for c in esquema], schema=esquema)
+
+
+def _generar_columnar(filas, abrir_escritor):
+    import pyarrow as pa
+
+    esquema = _esquema_arrow(pa)
+    salida = _SalidaEnBloques()
+    escritor = abrir_escritor(pa, salida, esquema)
+    yield salida.drenar() # Encabezado: el cliente recibe bytes antes de leer el primer lote
+    try:
+        for lote in _lotes_arrow(pa, esquema, filas):
+            escritor.write_batch(lote)
+            yield salida.drenar()
+    finally:
+        escritor.close()
+    yield salida.drenar() # Pie del archivo (metadatos)
+
+
+def generar_parquet(filas):
+    """Parquet comprimido con zstd, un row group por lote."""
+    def abrir(pa, salida, esquema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(salida, esquema, compression='zstd')
+    return _generar_columnar(filas, abrir)
+
+
+def generar_arrow(filas):
+    """
+    Arrow IPC en formato stream (.arrows), un record batch por lote. Se usa el formato stream porque
+    cada lote trae sus propios diccionarios, y el formato archivo solo admite uno por columna.
+    """
+    return _generar_columnar(filas, lambda pa, salida, esquema: pa.ipc.new_stream(salida, esquema))
+
+
+# formato -> (generador, mimetype, extensión, admite gzip)
+FORMATOS = {
+    'csv': (generar_csv, 'text/csv', 'csv', True), # Flask agrega charset=utf-8
+    'ndjson': (generar_ndjson, 'application/x-ndjson', 'ndjson', True),
+    'parquet': (generar_parquet, 'application/vnd.apache.parquet', 'parquet', False), # Ya comprime por columna
+    'arrow': (generar_arrow, 'application/vnd.apache.arrow.stream', 'arrows', False),
+}
+
+FORMATOS_COLUMNARES = ('parquet', 'arrow')
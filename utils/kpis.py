@@ -0,0 +1,70 @@
+from flask import current_app
+from datetime import datetime, timedelta
+from database.connection import execute_query, primary_reads
+from utils.cache import TTLCache
+
+# --- KPIs DE LOS DASHBOARDS (Doctor y Enfermero) ---
+
+# Todos los contadores de ambos roles en una sola sentencia:
+# - qr se recorre una sola vez (ix_qr_estado_paciente_fecha cubre estado y paciente_id)
+# - paciente se resuelve con dos subconsultas que usan ix_paciente_resultado_sexo_edad e ix_paciente_fecha_registro
+QUERY_KPIS = """
+SELECT
+    COUNT(q.id) AS qrs_generados,
+    COALESCE(SUM(CASE WHEN q.paciente_id IS NOT NULL THEN 1 ELSE 0 END), 0) AS qrs_vinculados,
+    COALESCE(SUM(CASE WHEN q.estado = 'Vinculado' THEN 1 ELSE 0 END), 0) AS pacientes_registrados,
+    COALESCE(SUM(CASE WHEN q.estado = 'Generado' AND q.paciente_id IS NULL THEN 1 ELSE 0 END), 0) AS qrs_pendientes,
+    (SELECT COUNT(id) FROM paciente WHERE resultado = 'Positivo') AS pacientes_positivos,
+    (SELECT COUNT(id) FROM paciente WHERE fecha_registro >= %s) AS nuevos_registros
+FROM qr q
+"""
+
+KPIS_VACIOS = {
+    'qrs_generados': 0,
+    'qrs_vinculados': 0,
+    'pacientes_registrados': 0,
+    'qrs_pendientes': 0,
+    'pacientes_positivos': 0,
+    'nuevos_registros': 0,
+}
+
+_cache = None
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(ttl=current_app.config.get('KPI_CACHE_TTL', 5))
+    return _cache
+
+
+def _calcular_kpis():
+    fecha_limite = (datetime.now() - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+    # De la primaria: una recarga después de invalidar_kpis() no debe cachear la réplica atrasada
+    with primary_reads():
+        fila = execute_query(QUERY_KPIS, (fecha_limite,), fetch_one=True, prepared=True)
+    if not fila:
+        return None # No se cachea un fallo
+    return {clave: int(fila.get(clave) or 0) for clave in KPIS_VACIOS}
+
+
+def obtener_kpis():
+    """
+    Contadores de los dashboards, compartidos por todos los usuarios del proceso.
+    Se cachean KPI_CACHE_TTL segundos (0 desactiva el cache) y se invalidan con invalidar_kpis().
+    Si la consulta falla devuelve todos los contadores en 0.
+    """
+    if not current_app.config.get('KPI_CACHE_TTL', 5):
+        return _calcular_kpis() or dict(KPIS_VACIOS)
+    return _get_cache().get_or_set('kpis', _calcular_kpis) or dict(KPIS_VACIOS)
+
+
+def invalidar_kpis():
+    """Descarta los KPIs cacheados; llamar después de escribir en qr o paciente."""
+    if _cache is not None:
+        _cache.invalidate('kpis')
+
+
+def get_kpi_cache_stats():
+    """Aciertos/fallos del cache de KPIs en este proceso."""
+    return _cache.stats() if _cache is not None else {}
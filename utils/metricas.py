@@ -0,0 +1,670 @@
+"""
+Resúmenes pre-agregados de métricas:
+- resumen_campana: totales por campaña (numero_campana, metrica, cantidad)
+- resumen_diario:  serie diaria por campaña (numero_campana, fecha, metrica, cantidad), donde
+  fecha es el día de registro del paciente (registros y resultados de esa cohorte)
+- resumen_geografico: cubo por área (numero_campana, nivel, padre_id, area_id, metrica, cantidad)
+  en los tres niveles estado > municipio > colonia, según la ubicación del QR
+
+Los contadores se actualizan de forma incremental en la MISMA transacción que la escritura que los origina:
+- registrar_qrs_generados: generar_qr (doctor)
+- registrar_vinculacion:   vincular_con_codigo (enfermero)
+- registrar_resultado:     guardar_resultado (paciente); también hace el UPDATE del resultado
+
+Cada uno también incrementa la versión 'metricas' de version_datos, que sirve de ETag a /doctor/api/metricas.
+
+Los reportes leen estos resúmenes (O(campañas) / O(días)) en lugar de recorrer paciente y qr.
+
+Reconstrucción completa (después de migrar o de cargas masivas que no pasan por las rutas):
+    python -m utils.metricas reconstruir
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from database.connection import execute_query, execute_many, get_backend, primary_reads, transaction
+from utils.cache import SWRCache
+
+# --- NOMBRES DE LAS MÉTRICAS ---
+
+METRICA_GENERADOS = 'generados'
+METRICA_VINCULADOS = 'vinculados'
+METRICA_RESULTADO = {'Positivo': 'positivos', 'Negativo': 'negativos'}
+PREFIJO_SEXO = 'sexo:'   # sexo:H, sexo:M, sexo:O (solo pacientes con resultado)
+PREFIJO_EDAD = 'edad:'   # edad:18-24 años, ... (solo pacientes con resultado y edad)
+METRICA_REGISTROS = 'registros' # Serie diaria: pacientes registrados y vinculados ese día
+
+# Niveles del cubo geográfico: (nivel, catálogo con los nombres). El padre de un municipio es
+# su estado y el de una colonia su municipio; los estados cuelgan de padre_id = 0.
+NIVELES_GEOGRAFICOS = {'estado': 'estados', 'municipio': 'municipios', 'colonia': 'colonias'}
+METRICAS_GEOGRAFICAS = (METRICA_GENERADOS, METRICA_VINCULADOS, 'positivos', 'negativos')
+SIN_AREA = 0 # QRs sin ubicación capturada
+
+# (límite superior incluido, etiqueta) en el orden en que se muestran
+RANGOS_EDAD = [
+    (5, '0-5 años'),
+    (10, '6-10 años'),
+    (17, '11-17 años'),
+    (24, '18-24 años'),
+    (34, '25-34 años'),
+    (44, '35-44 años'),
+    (54, '45-54 años'),
+    (None, '55+ años'),
+]
+RANGO_NO_ESPECIFICADO = 'No especificado'
+
+VERSION_METRICAS = 'metricas' # Fila de version_datos que cambia con cada escritura en los resúmenes
+
+
+def clasificar_sexo(sexo):
+    """Normaliza el sexo capturado a las claves de la gráfica: H (hombre), M (mujer), O (otro)."""
+    valor = str(sexo or 'O').upper().strip()
+    if 'MASCULINO' in valor or valor == 'H' or valor == 'M':
+        return 'H'
+    if 'FEMENINO' in valor or valor == 'F':
+        return 'M'
+    return 'O'
+
+
+def rango_edad(edad):
+    """Etiqueta del rango de edad (None si la edad no se capturó)."""
+    if edad is None:
+        return None
+    edad = int(edad)
+    if edad < 0:
+        return RANGO_NO_ESPECIFICADO
+    for limite, etiqueta in RANGOS_EDAD:
+        if limite is None or edad <= limite:
+            return etiqueta
+
+
+def _deltas_evaluacion(resultado, sexo, edad, signo=1):
+    """Contadores que aporta (o retira, con signo=-1) un paciente evaluado."""
+    deltas = {PREFIJO_SEXO + clasificar_sexo(sexo): signo}
+    metrica_resultado = METRICA_RESULTADO.get(resultado)
+    if metrica_resultado:
+        deltas[metrica_resultado] = signo
+    etiqueta = rango_edad(edad)
+    if etiqueta:
+        deltas[PREFIJO_EDAD + etiqueta] = signo
+    return deltas
+
+
+# --- ACTUALIZACIÓN INCREMENTAL ---
+
+def _query_incremento(tabla, claves, filas):
+    """INSERT multi-fila que suma a los contadores existentes de `tabla` (upsert según el backend)."""
+    columnas = claves + ['metrica', 'cantidad']
+    valores = ", ".join(["(" + ", ".join(["%s"] * len(columnas)) + ")"] * filas)
+    if get_backend().name == 'sqlite':
+        conflicto = f"ON CONFLICT ({', '.join(claves + ['metrica'])}) DO UPDATE SET cantidad = cantidad + excluded.cantidad"
+    else:
+        # Alias de fila (MySQL 8.0.19+): VALUES() en el UPDATE está obsoleto y emite la advertencia 1287,
+        # que con raise_on_warnings se convierte en excepción
+        conflicto = "AS nuevo ON DUPLICATE KEY UPDATE cantidad = cantidad + nuevo.cantidad"
+    return f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES {valores} {conflicto}"
+
+
+def _incrementar_filas(tabla, claves, filas):
+    """Suma las `filas` [(valores de las claves..., metrica, cantidad)] en una sola sentencia."""
+    filas = [fila for fila in filas if fila[-1] and not any(v is None for v in fila[:-2])]
+    if not filas:
+        return
+    params = [valor for fila in filas for valor in fila]
+    execute_query(_query_incremento(tabla, claves, len(filas)), tuple(params), commit=True)
+
+
+def _incrementar_tabla(tabla, claves, valores_clave, deltas):
+    _incrementar_filas(tabla, claves, [(*valores_clave, metrica, cantidad) for metrica, cantidad in deltas.items()])
+
+
+def incrementar(numero_campana, deltas):
+    """
+    Suma `deltas` ({metrica: cantidad}) a los contadores de la campaña en una sola sentencia.
+    Debe llamarse dentro de `transaction()` junto con la escritura que origina el cambio.
+    """
+    _incrementar_tabla('resumen_campana', ['numero_campana'], (numero_campana,), deltas)
+
+
+def _dia(valor):
+    """Fecha (date) de un DATETIME/DATE o de su texto 'AAAA-MM-DD...'."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10]) if valor else None
+
+
+def incrementar_diario(numero_campana, fecha, deltas):
+    """Igual que incrementar(), sobre la fila diaria de la campaña (resumen_diario)."""
+    _incrementar_tabla('resumen_diario', ['numero_campana', 'fecha'], (numero_campana, _dia(fecha)), deltas)
+
+
+def _area(valor):
+    return int(valor) if valor not in (None, '') else SIN_AREA
+
+
+def _filas_geograficas(numero_campana, id_estado, id_municipio, id_colonia, deltas):
+    """Una fila por nivel (estado, municipio, colonia) y métrica del cubo geográfico."""
+    niveles = [
+        ('estado', SIN_AREA, _area(id_estado)),
+        ('municipio', _area(id_estado), _area(id_municipio)),
+        ('colonia', _area(id_municipio), _area(id_colonia)),
+    ]
+    return [
+        (numero_campana, nivel, padre_id, area_id, metrica, cantidad)
+        for nivel, padre_id, area_id in niveles
+        for metrica, cantidad in deltas.items() if metrica in METRICAS_GEOGRAFICAS
+    ]
+
+
+def incrementar_geografico(numero_campana, id_estado, id_municipio, id_colonia, deltas):
+    """Igual que incrementar(), en los tres niveles del cubo geográfico (una sola sentencia)."""
+    _incrementar_filas(
+        'resumen_geografico', ['numero_campana', 'nivel', 'padre_id', 'area_id'],
+        _filas_geograficas(numero_campana, id_estado, id_municipio, id_colonia, deltas)
+    )
+
+
+def marcar_cambio():
+    """
+    Incrementa la versión de los datos de métricas. Se llama al final de cada registrar_*, dentro
+    de su transacción, para que la versión solo cambie si la escritura se confirma.
+    """
+    execute_query("UPDATE version_datos SET version = version + 1 WHERE nombre = %s", (VERSION_METRICAS,), commit=True)
+
+
+def registrar_qrs_generados(numero_campana, cantidad, id_estado=None, id_municipio=None, id_colonia=None):
+    incrementar(numero_campana, {METRICA_GENERADOS: cantidad})
+    incrementar_geografico(numero_campana, id_estado, id_municipio, id_colonia, {METRICA_GENERADOS: cantidad})
+    marcar_cambio()
+
+
+def registrar_vinculacion(codigo_qr):
+    """Cuenta el QR `codigo_qr` (ya vinculado) en su campaña, en su área y el registro en el día del paciente."""
+    qr = execute_query("""
+        SELECT q.numero_campana, q.id_estado, q.id_municipio, q.id_colonia, p.fecha_registro
+        FROM qr q
+        LEFT JOIN paciente p ON p.id = q.paciente_id
+        WHERE q.codigo = %s
+    """, (codigo_qr,), fetch_one=True)
+    if qr:
+        incrementar(qr['numero_campana'], {METRICA_VINCULADOS: 1})
+        incrementar_diario(qr['numero_campana'], qr['fecha_registro'], {METRICA_REGISTROS: 1})
+        incrementar_geografico(qr['numero_campana'], qr['id_estado'], qr['id_municipio'], qr['id_colonia'],
+                               {METRICA_VINCULADOS: 1})
+        marcar_cambio()
+
+
+def registrar_resultado(paciente_id, resultado):
+    """
+    Guarda el resultado del paciente y actualiza los resúmenes de su campaña.
+    - Primera captura: suma el resultado, el sexo y el rango de edad.
+    - Cambio de resultado: mueve el conteo de un resultado al otro.
+    El UPDATE va primero para bloquear la fila: dos envíos simultáneos no cuentan doble.
+    Devuelve el número de filas actualizadas (0 si el resultado no cambió o el paciente no existe).
+    """
+    actualizadas = execute_query(
+        "UPDATE paciente SET resultado = %s WHERE id = %s AND resultado IS NULL",
+        (resultado, paciente_id), commit=True
+    )
+    primera_captura = bool(actualizadas)
+    if not primera_captura:
+        actualizadas = execute_query(
+            "UPDATE paciente SET resultado = %s WHERE id = %s AND resultado <> %s",
+            (resultado, paciente_id, resultado), commit=True
+        )
+        if not actualizadas:
+            return 0
+
+    paciente = execute_query("""
+        SELECT q.numero_campana, q.id_estado, q.id_municipio, q.id_colonia, p.sexo, p.edad, p.fecha_registro
+        FROM paciente p
+        JOIN qr q ON q.paciente_id = p.id
+        WHERE p.id = %s
+    """, (paciente_id,), fetch_one=True)
+    if not paciente:
+        return actualizadas
+
+    if primera_captura:
+        deltas = _deltas_evaluacion(resultado, paciente['sexo'], paciente['edad'])
+    else:
+        anterior = 'Negativo' if resultado == 'Positivo' else 'Positivo'
+        deltas = {METRICA_RESULTADO.get(anterior): -1, METRICA_RESULTADO.get(resultado): 1}
+        deltas.pop(None, None)
+    deltas_resultado = {metrica: cantidad for metrica, cantidad in deltas.items() if metrica in METRICA_RESULTADO.values()}
+    incrementar(paciente['numero_campana'], deltas)
+    incrementar_diario(paciente['numero_campana'], paciente['fecha_registro'], deltas_resultado)
+    incrementar_geografico(paciente['numero_campana'], paciente['id_estado'], paciente['id_municipio'],
+                           paciente['id_colonia'], deltas_resultado)
+    marcar_cambio()
+    return actualizadas
+
+
+# --- LECTURA ---
+
+# Consultas de lectura a nivel de módulo: migrations.HOT_QUERIES las verifica con EXPLAIN
+QUERY_RESUMEN_CAMPANA = "SELECT metrica, cantidad FROM resumen_campana WHERE numero_campana = %s"
+QUERY_RESUMEN_TOTAL = "SELECT metrica, SUM(cantidad) AS cantidad FROM resumen_campana GROUP BY metrica"
+QUERY_VERSION = "SELECT version FROM version_datos WHERE nombre = %s"
+QUERY_CAMPANAS = """
+SELECT numero_campana, cantidad AS total_qrs
+FROM resumen_campana
+WHERE metrica = 'generados'
+ORDER BY numero_campana DESC
+"""
+
+def leer_resumen(numero_campana=None):
+    """
+    Contadores {metrica: cantidad} de una campaña, o sumados sobre todas si no se indica.
+    Una sola consulta sobre resumen_campana (crece con el número de campañas, no de pacientes).
+    Devuelve None si la consulta falla.
+    """
+    if numero_campana:
+        filas = execute_query(QUERY_RESUMEN_CAMPANA, (numero_campana,))
+    else:
+        filas = execute_query(QUERY_RESUMEN_TOTAL)
+    if filas == 0:
+        return None
+    return {fila['metrica']: int(fila['cantidad'] or 0) for fila in (filas or [])}
+
+
+def leer_version():
+    """
+    Versión actual de los datos de métricas (0 si aún no hay fila), o None si la consulta falla.
+    Se lee de la primaria: es el ETag, y una versión atrasada de la réplica validaría datos viejos.
+    """
+    with primary_reads():
+        fila = execute_query(QUERY_VERSION, (VERSION_METRICAS,), fetch_one=True)
+    if fila == 0:
+        return None
+    return int(fila['version']) if fila else 0
+
+
+def leer_resumenes(campanas):
+    """
+    Contadores {numero_campana: {metrica: cantidad}} de varias campañas con una sola consulta
+    sobre resumen_campana (el costo no depende del número de pacientes). Las campañas sin
+    datos aparecen con contadores vacíos. Devuelve None si la consulta falla.
+    """
+    resultado = {campana: {} for campana in campanas}
+    if not resultado:
+        return resultado
+    marcadores = ', '.join(['%s'] * len(resultado))
+    filas = execute_query(
+        f"SELECT numero_campana, metrica, cantidad FROM resumen_campana WHERE numero_campana IN ({marcadores})",
+        tuple(resultado)
+    )
+    if filas == 0:
+        return None
+    for fila in filas or []:
+        resultado[fila['numero_campana']][fila['metrica']] = int(fila['cantidad'] or 0)
+    return resultado
+
+
+def listar_campanas():
+    """Campañas con su número de QRs generados, de la más reciente a la más antigua (None si falla)."""
+    filas = execute_query(QUERY_CAMPANAS)
+    return None if filas == 0 else filas or []
+
+
+def leer_tendencias(desde, hasta, numero_campana=None, intervalo='dia'):
+    """
+    Serie de registros, resultados y positividad entre `desde` y `hasta` (date, inclusive),
+    por día o por semana (lunes a domingo), a partir de resumen_diario. Los periodos sin datos
+    aparecen en cero. Devuelve None si la consulta falla.
+    """
+    query = "SELECT fecha, metrica, SUM(cantidad) AS cantidad FROM resumen_diario WHERE fecha BETWEEN %s AND %s"
+    params = [desde, hasta]
+    if numero_campana:
+        query += " AND numero_campana = %s"
+        params.append(numero_campana)
+    query += " GROUP BY fecha, metrica"
+
+    filas = execute_query(query, tuple(params))
+    if filas == 0:
+        return None
+
+    def inicio_periodo(dia):
+        return dia - timedelta(days=dia.weekday()) if intervalo == 'semana' else dia
+
+    paso = timedelta(days=7 if intervalo == 'semana' else 1)
+    metricas = [METRICA_REGISTROS] + list(METRICA_RESULTADO.values())
+    serie = {}
+    periodo = inicio_periodo(desde)
+    while periodo <= hasta:
+        serie[periodo] = dict.fromkeys(metricas, 0)
+        periodo += paso
+
+    for fila in filas or []:
+        puntos = serie.get(inicio_periodo(_dia(fila['fecha'])))
+        if puntos is not None and fila['metrica'] in puntos:
+            puntos[fila['metrica']] += int(fila['cantidad'] or 0)
+
+    resultado = []
+    for periodo, puntos in serie.items():
+        evaluados = puntos[METRICA_RESULTADO['Positivo']] + puntos[METRICA_RESULTADO['Negativo']]
+        resultado.append({
+            'periodo': periodo.isoformat(),
+            **puntos,
+            'positividad': round(puntos[METRICA_RESULTADO['Positivo']] * 100.0 / evaluados, 1) if evaluados else None,
+        })
+    return resultado
+
+
+def leer_geografico(nivel='estado', padre_id=None, numero_campana=None):
+    """
+    Desglose por área de un nivel del cubo geográfico (solo filas pre-agregadas, con el nombre
+    del catálogo). `padre_id` limita a las áreas dentro de un estado (nivel municipio) o de un
+    municipio (nivel colonia). Ordenado por evaluaciones. Devuelve None si la consulta falla.
+    """
+    catalogo = NIVELES_GEOGRAFICOS[nivel] # KeyError si el nivel no es válido
+    query = f"""
+    SELECT g.area_id, c.nombre, g.metrica, SUM(g.cantidad) AS cantidad
+    FROM resumen_geografico g
+    LEFT JOIN {catalogo} c ON c.id = g.area_id
+    WHERE g.nivel = %s
+    """
+    params = [nivel]
+    if padre_id is not None:
+        query += " AND g.padre_id = %s"
+        params.append(padre_id)
+    if numero_campana:
+        query += " AND g.numero_campana = %s"
+        params.append(numero_campana)
+    query += " GROUP BY g.area_id, c.nombre, g.metrica"
+
+    filas = execute_query(query, tuple(params))
+    if filas == 0:
+        return None
+
+    areas = {}
+    for fila in filas or []:
+        area = areas.setdefault(fila['area_id'], {
+            'id': fila['area_id'],
+            'nombre': fila['nombre'] or ('Sin especificar' if fila['area_id'] == SIN_AREA else f"ID {fila['area_id']}"),
+            **dict.fromkeys(METRICAS_GEOGRAFICAS, 0),
+        })
+        area[fila['metrica']] += int(fila['cantidad'] or 0)
+
+    resultado = []
+    for area in areas.values():
+        evaluaciones = area['positivos'] + area['negativos']
+        area['evaluaciones'] = evaluaciones
+        area['tasa_positividad'] = round(area['positivos'] * 100.0 / evaluaciones, 1) if evaluaciones else 0.0
+        area['tasa_vinculacion'] = round(area[METRICA_VINCULADOS] * 100.0 / area[METRICA_GENERADOS], 1) if area[METRICA_GENERADOS] else 0.0
+        resultado.append(area)
+    resultado.sort(key=lambda a: (-a['evaluaciones'], -a[METRICA_GENERADOS], str(a['nombre'])))
+    return resultado
+
+
+# --- CÁLCULO DIRECTO (AGREGACIÓN CONDICIONAL) ---
+
+# Los contadores se calculan en SQL con agregación condicional (SUM(CASE ...)) sobre sexo y rango
+# de edad; Python solo renombra las columnas. Los evaluados se agrupan primero por (resultado, sexo,
+# edad): en la vista global ese GROUP BY se resuelve leyendo en orden el índice cubriente
+# ix_paciente_resultado_sexo_edad, y los CASE se evalúan sobre unos cientos de grupos en lugar de
+# sobre cada paciente. El texto es constante y la campaña va como parámetro (preparable).
+
+# Misma clasificación que clasificar_sexo() (INSTR existe en MySQL y en SQLite)
+_SEXO_SQL = "UPPER(TRIM(COALESCE(g.sexo, 'O')))"
+_ES_HOMBRE = f"(INSTR({_SEXO_SQL}, 'MASCULINO') > 0 OR {_SEXO_SQL} IN ('H', 'M'))"
+_ES_MUJER = f"(INSTR({_SEXO_SQL}, 'FEMENINO') > 0 OR {_SEXO_SQL} = 'F')"
+
+
+def _columnas_edad():
+    """(alias, condición SQL, etiqueta) de cada rango de edad, en el orden de RANGOS_EDAD."""
+    columnas, minimo = [], 0
+    for indice, (limite, etiqueta) in enumerate(RANGOS_EDAD):
+        condicion = f"g.edad BETWEEN {minimo} AND {limite}" if limite is not None else f"g.edad >= {minimo}"
+        columnas.append((f"edad_{indice}", condicion, etiqueta))
+        minimo = (limite or 0) + 1
+    columnas.append(("edad_ne", "g.edad < 0", RANGO_NO_ESPECIFICADO))
+    return columnas
+
+
+_COLUMNAS_EDAD = _columnas_edad()
+
+# Sobre los grupos `g` (resultado, sexo, edad, n) de pacientes con resultado
+_AGREGADOS_EVALUADOS = ",\n       ".join([
+    "SUM(CASE WHEN g.resultado = 'Positivo' THEN g.n ELSE 0 END) AS positivos",
+    "SUM(CASE WHEN g.resultado = 'Negativo' THEN g.n ELSE 0 END) AS negativos",
+    f"SUM(CASE WHEN {_ES_HOMBRE} THEN g.n ELSE 0 END) AS sexo_h",
+    f"SUM(CASE WHEN {_ES_HOMBRE} THEN 0 WHEN {_ES_MUJER} THEN g.n ELSE 0 END) AS sexo_m",
+    f"SUM(CASE WHEN {_ES_HOMBRE} OR {_ES_MUJER} THEN 0 ELSE g.n END) AS sexo_o",
+] + [f"SUM(CASE WHEN {condicion} THEN g.n ELSE 0 END) AS {alias}" for alias, condicion, _ in _COLUMNAS_EDAD])
+
+# Vista global: los pacientes solo se crean al vincular un QR, así que no hace falta el JOIN con qr
+QUERY_METRICAS_TODAS = f"""
+SELECT (SELECT COUNT(id) FROM qr) AS generados,
+       (SELECT COUNT(paciente_id) FROM qr) AS vinculados,
+       {_AGREGADOS_EVALUADOS}
+FROM (
+    SELECT p.resultado, p.sexo, p.edad, COUNT(*) AS n
+    FROM paciente p
+    WHERE p.resultado IS NOT NULL
+    GROUP BY p.resultado, p.sexo, p.edad
+) g
+"""
+
+# Una campaña: qr por ix_qr_campana_paciente y sus pacientes por llave primaria
+QUERY_METRICAS_CAMPANA = f"""
+SELECT (SELECT COUNT(id) FROM qr WHERE numero_campana = %s) AS generados,
+       (SELECT COUNT(paciente_id) FROM qr WHERE numero_campana = %s) AS vinculados,
+       {_AGREGADOS_EVALUADOS}
+FROM (
+    SELECT p.resultado, p.sexo, p.edad, COUNT(*) AS n
+    FROM qr q
+    JOIN paciente p ON p.id = q.paciente_id
+    WHERE q.numero_campana = %s AND p.resultado IS NOT NULL
+    GROUP BY p.resultado, p.sexo, p.edad
+) g
+"""
+
+# Todas las campañas, una fila por campaña (solo para reconstruir resumen_campana)
+QUERY_METRICAS_POR_CAMPANA = f"""
+SELECT c.numero_campana, c.generados, c.vinculados,
+       {_AGREGADOS_EVALUADOS}
+FROM (
+    SELECT numero_campana, COUNT(id) AS generados, COUNT(paciente_id) AS vinculados
+    FROM qr
+    GROUP BY numero_campana
+) c
+LEFT JOIN (
+    SELECT q.numero_campana, p.resultado, p.sexo, p.edad, COUNT(*) AS n
+    FROM qr q
+    JOIN paciente p ON p.id = q.paciente_id
+    WHERE p.resultado IS NOT NULL
+    GROUP BY q.numero_campana, p.resultado, p.sexo, p.edad
+) g ON g.numero_campana = c.numero_campana
+GROUP BY c.numero_campana, c.generados, c.vinculados
+"""
+
+
+def _resumen_de_fila(fila):
+    """Contadores {metrica: cantidad} (sin ceros) de una fila de las consultas QUERY_METRICAS_*."""
+    columnas = [
+        (METRICA_GENERADOS, 'generados'), (METRICA_VINCULADOS, 'vinculados'),
+        (METRICA_RESULTADO['Positivo'], 'positivos'), (METRICA_RESULTADO['Negativo'], 'negativos'),
+        (PREFIJO_SEXO + 'H', 'sexo_h'), (PREFIJO_SEXO + 'M', 'sexo_m'), (PREFIJO_SEXO + 'O', 'sexo_o'),
+    ] + [(PREFIJO_EDAD + etiqueta, alias) for alias, _, etiqueta in _COLUMNAS_EDAD]
+    resumen = {}
+    for metrica, columna in columnas:
+        cantidad = int(fila[columna] or 0) # SUM de cero grupos es NULL
+        if cantidad:
+            resumen[metrica] = cantidad
+    return resumen
+
+
+def calcular_por_campana():
+    """Contadores {numero_campana: {metrica: cantidad}} calculados desde qr y paciente en una sola consulta."""
+    return {
+        fila['numero_campana']: _resumen_de_fila(fila)
+        for fila in execute_query(QUERY_METRICAS_POR_CAMPANA, prepared=True) or []
+    }
+
+
+def calcular_resumen_directo(numero_campana=None):
+    """
+    Igual que leer_resumen() pero calculado desde las tablas de origen (una sola consulta
+    parametrizada). Sirve cuando resumen_campana no está disponible.
+    """
+    if numero_campana:
+        fila = execute_query(QUERY_METRICAS_CAMPANA, (numero_campana,) * 3, fetch_one=True, prepared=True)
+    else:
+        fila = execute_query(QUERY_METRICAS_TODAS, fetch_one=True, prepared=True)
+    if not fila:
+        return None
+    return _resumen_de_fila(fila)
+
+
+def calcular_por_dia():
+    """Contadores {(numero_campana, fecha): {metrica: cantidad}} desde paciente y qr (solo para reconstruir)."""
+    por_dia = {}
+    for fila in execute_query("""
+        SELECT q.numero_campana, DATE(p.fecha_registro) AS fecha, p.resultado, COUNT(p.id) AS total
+        FROM qr q
+        JOIN paciente p ON p.id = q.paciente_id
+        GROUP BY q.numero_campana, DATE(p.fecha_registro), p.resultado
+    """) or []:
+        contadores = por_dia.setdefault((fila['numero_campana'], str(fila['fecha'])[:10]), {})
+        total = int(fila['total'] or 0)
+        contadores[METRICA_REGISTROS] = contadores.get(METRICA_REGISTROS, 0) + total
+        metrica_resultado = METRICA_RESULTADO.get(fila['resultado'])
+        if metrica_resultado:
+            contadores[metrica_resultado] = contadores.get(metrica_resultado, 0) + total
+    return por_dia
+
+
+def calcular_geografico():
+    """Filas del cubo geográfico [(campaña, nivel, padre_id, area_id, metrica, cantidad)] (solo para reconstruir)."""
+    cubo = {}
+    for fila in execute_query("""
+        SELECT q.numero_campana, q.id_estado, q.id_municipio, q.id_colonia, p.resultado,
+               COUNT(q.id) AS generados, COUNT(q.paciente_id) AS vinculados
+        FROM qr q
+        LEFT JOIN paciente p ON p.id = q.paciente_id
+        GROUP BY q.numero_campana, q.id_estado, q.id_municipio, q.id_colonia, p.resultado
+    """) or []:
+        deltas = {METRICA_GENERADOS: int(fila['generados'] or 0), METRICA_VINCULADOS: int(fila['vinculados'] or 0)}
+        metrica_resultado = METRICA_RESULTADO.get(fila['resultado'])
+        if metrica_resultado:
+            deltas[metrica_resultado] = int(fila['vinculados'] or 0)
+        for *clave, metrica, cantidad in _filas_geograficas(
+                fila['numero_campana'], fila['id_estado'], fila['id_municipio'], fila['id_colonia'], deltas):
+            clave = (*clave, metrica)
+            cubo[clave] = cubo.get(clave, 0) + cantidad
+    return [(*clave, cantidad) for clave, cantidad in cubo.items() if cantidad]
+
+
+def formatear_metricas(resumen):
+    """Convierte los contadores {metrica: cantidad} en el diccionario que usan reportes.html y el PDF."""
+    positivos = resumen.get(METRICA_RESULTADO['Positivo'], 0)
+    negativos = resumen.get(METRICA_RESULTADO['Negativo'], 0)
+    distribucion_sexo = {sexo: resumen.get(PREFIJO_SEXO + sexo, 0) for sexo in ('H', 'M', 'O')}
+    # Total de evaluaciones = pacientes con resultado (cada uno cuenta una vez en la distribución por sexo)
+    total = sum(distribucion_sexo.values())
+
+    # Distribución por rango de edad, en orden y solo con los rangos que tienen casos
+    distribucion_edad = {}
+    for etiqueta in [e for _, e in RANGOS_EDAD] + [RANGO_NO_ESPECIFICADO]:
+        cantidad = resumen.get(PREFIJO_EDAD + etiqueta, 0)
+        if cantidad:
+            distribucion_edad[etiqueta] = cantidad
+
+    return {
+        'codigos_generados': resumen.get(METRICA_GENERADOS, 0),
+        'codigos_vinculados': resumen.get(METRICA_VINCULADOS, 0),
+        'total_evaluaciones': total,
+        'casos_positivos': positivos,
+        'casos_negativos': negativos,
+        'tasa_positividad': round((float(positivos) / total) * 100, 1) if total > 0 else 0.0,
+        'tasa_negativa': round((float(negativos) / total) * 100, 1) if total > 0 else 0.0,
+        'distribucion_sexo': distribucion_sexo,
+        'distribucion_edad': distribucion_edad,
+    }
+
+
+# --- CACHE DE REPORTES (stale-while-revalidate) ---
+
+_reportes_cache = SWRCache('reportes')
+
+
+def obtener_cacheado(clave, loader):
+    """
+    Devuelve (valor, calculado_en) desde el cache de reportes. Si el valor tiene más de
+    REPORT_CACHE_MAX_AGE segundos se sirve igual y se recalcula en segundo plano.
+    `loader` debe lanzar una excepción si falla, para no reemplazar datos buenos por vacíos.
+    """
+    def cargar_de_primaria():
+        # Una recarga después de invalidar_reportes() no debe leer la réplica atrasada
+        with primary_reads():
+            return loader()
+
+    max_age = current_app.config.get('REPORT_CACHE_MAX_AGE', 60)
+    return _reportes_cache.get(clave, cargar_de_primaria, max_age, current_app._get_current_object())
+
+
+def invalidar_reportes():
+    """Marca los reportes cacheados como vencidos; llamar después de escribir en qr o paciente."""
+    _reportes_cache.invalidate()
+
+
+def get_reportes_cache_stats():
+    return _reportes_cache.stats()
+
+
+# --- RECONSTRUCCIÓN ---
+
+def reconstruir_resumen():
+    """
+    Recalcula resumen_campana, resumen_diario y resumen_geografico desde qr y paciente en una sola transacción
+    (las lecturas también van dentro, contra la primaria). Devuelve el número de contadores escritos.
+    """
+    with transaction():
+        por_campana = calcular_por_campana()
+        filas = [
+            (campana, metrica, cantidad)
+            for campana, resumen in por_campana.items()
+            for metrica, cantidad in resumen.items() if cantidad
+        ]
+        filas_diarias = [
+            (campana, _dia(fecha), metrica, cantidad)
+            for (campana, fecha), resumen in calcular_por_dia().items()
+            for metrica, cantidad in resumen.items() if cantidad
+        ]
+        execute_query("DELETE FROM resumen_campana", commit=True)
+        execute_many("INSERT INTO resumen_campana (numero_campana, metrica, cantidad) VALUES (%s, %s, %s)", filas)
+        filas_geograficas = calcular_geografico()
+        execute_query("DELETE FROM resumen_diario", commit=True)
+        execute_many(
+            "INSERT INTO resumen_diario (numero_campana, fecha, metrica, cantidad) VALUES (%s, %s, %s, %s)",
+            filas_diarias
+        )
+        execute_query("DELETE FROM resumen_geografico", commit=True)
+        execute_many(
+            "INSERT INTO resumen_geografico (numero_campana, nivel, padre_id, area_id, metrica, cantidad) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            filas_geograficas
+        )
+        marcar_cambio()
+    return len(filas) + len(filas_diarias) + len(filas_geograficas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumen de métricas por campaña")
+    parser.add_argument('comando', choices=['reconstruir'])
+    parser.parse_args(argv)
+
+    from app import app
+
+    with app.app_context():
+        total = reconstruir_resumen()
+        print(f"Resumen de campañas reconstruido ({total} contadores).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,46 +1,39 @@
 # utils/qr_manager.py
 
 import os
+import base64
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
 import qrcode
+from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from flask import current_app, url_for
+from utils.cache import LRUCache
 
 def generar_qr_y_pdf(qr_token, url_acceso):
     """
-    Genera la imagen del Código QR con la URL de acceso y la incrusta en un PDF.
+    Genera el Código QR con la URL de acceso y lo dibuja en un PDF.
     
     :param qr_token: Token único que identifica el QR.
     :param url_acceso: La URL completa que el paciente escaneará.
     :return: La ruta completa del archivo PDF generado.
     """
     
-    # Rutas de archivos: Obtener la ruta de la carpeta de configuración
-    qr_filename = f'QR_{qr_token}.png'
+    # Ruta del PDF: Obtener la carpeta de configuración
     pdf_filename = f'QR_{qr_token}.pdf'
-    
-    qr_img_path = os.path.join(current_app.config['QR_PDF_FOLDER'], qr_filename)
     pdf_path = os.path.join(current_app.config['QR_PDF_FOLDER'], pdf_filename)
 
-    # --- 1. Generar la Imagen del Código QR ---
+    # --- 1. Calcular la matriz del Código QR (ya no se escribe una imagen temporal a disco) ---
     try:
-        # Crea el objeto QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url_acceso)
-        qr.make(fit=True)
-
-        # Crea la imagen del QR y la guarda temporalmente
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save(qr_img_path)
+        matriz = render_qr(url_acceso, error_correction=qrcode.constants.ERROR_CORRECT_L)
 
     except Exception as e:
-        print(f"Error al generar la imagen QR: {e}")
+        print(f"Error al generar el código QR: {e}")
         # En una aplicación real, aquí podrías manejar el error de forma más elegante
         raise 
 
@@ -49,9 +42,6 @@ def generar_qr_y_pdf(qr_token, url_acceso):
         c = canvas.Canvas(pdf_path, pagesize=letter)
         ancho, alto = letter
 
-        # ... [El resto del código de ReportLab para dibujar el PDF] ...
-        # (Este código es largo, pero crucial. Asegúrate de que esté incluido)
-
         # Título
         c.setFont("Helvetica-Bold", 16)
         c.drawCentredString(ancho / 2, alto - inch, "Sistema de Autoprueba VIH")
@@ -63,13 +53,12 @@ def generar_qr_y_pdf(qr_token, url_acceso):
         c.drawString(inch, alto - 1.9 * inch, "2. Siga las instrucciones en pantalla para completar la autoprueba.")
         c.drawString(inch, alto - 2.1 * inch, f"3. Token de Referencia: {qr_token}")
 
-        # Incrustar la imagen del QR
+        # Dibujar el QR como vectores
         qr_width = 3 * inch
-        qr_height = 3 * inch 
         x_pos = (ancho - qr_width) / 2
         y_pos = alto - 5.5 * inch
         
-        c.drawImage(qr_img_path, x_pos, y_pos, width=qr_width, height=qr_height)
+        dibujar_qr(c, matriz, x_pos, y_pos, qr_width)
 
         # Pie de página
         c.setFont("Helvetica-Oblique", 10)
@@ -81,11 +70,177 @@ def generar_qr_y_pdf(qr_token, url_acceso):
     except Exception as e:
         print(f"Error al generar el PDF: {e}")
         raise
-    finally:
-        # 3. Eliminar la imagen temporal del QR
-        if os.path.exists(qr_img_path):
-            os.remove(qr_img_path)
             
     return pdf_path # ¡Retorna la ruta del PDF!
 
-# NOTA: Asegúrate de que las dependencias 'qrcode' y 'reportlab' estén instaladas
\ No newline at end of file
+# NOTA: Asegúrate de que las dependencias 'qrcode' y 'reportlab' estén instaladas
+
+
+# --- RENDERIZADO DE LOTES: MATRICES QR EN UN POOL DE PROCESOS ---
+# Calcular la matriz del QR (codificación Reed-Solomon en Python puro) es la parte cara de cada
+# código y no libera el GIL: en lotes se reparte entre procesos. El proceso de la solicitud solo
+# dibuja cada matriz en el PDF como vectores (dibujar_qr).
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def matriz_qr(url, error_correction=qrcode.constants.ERROR_CORRECT_M, border=4):
+    """
+    Matriz del QR de `url` (por defecto, mismos parámetros que qrcode.make; borde incluido) como
+    tupla de filas en bytes: 1 = módulo oscuro. Se compacta así para enviarla barata entre procesos.
+    """
+    qr = qrcode.QRCode(error_correction=error_correction, border=border)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return tuple(bytes(fila) for fila in qr.get_matrix())
+
+
+def _tramos(matriz):
+    """(fila, columna inicial, largo) de cada tramo horizontal de módulos oscuros."""
+    for fila_indice, fila in enumerate(matriz):
+        columna, lado = 0, len(fila)
+        while columna < lado:
+            if not fila[columna]:
+                columna += 1
+                continue
+            inicio = columna
+            while columna < lado and fila[columna]:
+                columna += 1
+            yield fila_indice, inicio, columna - inicio
+
+
+def dibujar_qr(c, matriz, x, y, tamano):
+    """
+    Dibuja la matriz en el canvas `c` como vectores: un rectángulo por cada tramo horizontal de
+    módulos oscuros, todos en un solo trazo relleno. (x, y) es la esquina inferior izquierda y
+    `tamano` el lado en puntos, borde incluido. Nítido a cualquier escala y sin imagen embebida.
+    """
+    modulo = tamano / len(matriz)
+    trazo = c.beginPath()
+    for fila, inicio, largo in _tramos(matriz):
+        trazo.rect(x + inicio * modulo, y + tamano - (fila + 1) * modulo, largo * modulo, modulo)
+    c.saveState()
+    c.setFillColorRGB(0, 0, 0)
+    c.drawPath(trazo, stroke=0, fill=1)
+    c.restoreState()
+
+
+def _procesos():
+    """Procesos del pool de este worker (QR_PROCESOS, fijo: no se escala con las CPUs, ver config.py)."""
+    return max(1, current_app.config.get('QR_PROCESOS', 2))
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            procesos = _procesos()
+            # 'spawn': el servidor tiene hilos y conexiones abiertas que no deben heredarse con fork
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def matrices_qr(urls):
+    """
+    Matrices de `urls` en el mismo orden. Con QR_PROCESOS > 1 y al menos QR_PARALELO_MINIMO códigos
+    se calculan en el pool de procesos (compartido entre solicitudes); si no, en este proceso y a
+    través del cache de renderizado.
+    """
+    urls = list(urls)
+    procesos = _procesos()
+    if procesos <= 1 or len(urls) < current_app.config.get('QR_PARALELO_MINIMO', 24):
+        return [render_qr(url) for url in urls]
+
+    # Los lotes grandes son códigos recién creados: no pasan por el cache para no desplazar a los populares
+
+    bloque = max(1, len(urls) // (procesos * 4)) # Pocas tareas grandes: menos idas y vueltas entre procesos
+    try:
+        return list(_obtener_pool().map(matriz_qr, urls, chunksize=bloque))
+    except BrokenProcessPool as e:
+        current_app.logger.error(f"Pool de procesos de QR caído, se calcula en el proceso actual: {e}")
+        _descartar_pool()
+        return [matriz_qr(url) for url in urls]
+
+
+
+# --- CACHE DE RENDERIZADO (compartido por todos los blueprints) ---
+# La misma URL de acceso se vuelve a codificar en cada vista de vincular_inicio, en cada descarga y en
+# cada PDF individual. El resultado solo depende de los parámetros, así que se guarda en un cache LRU
+# de QR_CACHE_ENTRADAS entradas: repetir un código popular cuesta una búsqueda en un diccionario.
+
+FORMATOS_QR = ('matriz', 'png', 'svg', 'data_uri')
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def _get_render_cache():
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = LRUCache(max_entries=current_app.config.get('QR_CACHE_ENTRADAS', 2048))
+        return _render_cache
+
+
+def png_qr(matriz, box_size):
+    """PNG de 1 bit de la matriz, `box_size` píxeles por módulo (mismo resultado que qrcode.make_image)."""
+    lado = len(matriz)
+    imagen = Image.frombytes('L', (lado, lado), b''.join(bytes(0 if m else 255 for m in fila) for fila in matriz))
+    imagen = imagen.resize((lado * box_size, lado * box_size), Image.NEAREST).convert('1')
+    buffer = BytesIO()
+    imagen.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def svg_qr(matriz, box_size):
+    """SVG de la matriz (un solo path, un tramo por subtrayecto) de `box_size` píxeles por módulo."""
+    lado = len(matriz)
+    trazo = ''.join(f"M{inicio} {fila}h{largo}v1h-{largo}z" for fila, inicio, largo in _tramos(matriz))
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{lado * box_size}" height="{lado * box_size}" '
+        f'viewBox="0 0 {lado} {lado}" shape-rendering="crispEdges">'
+        f'<rect width="{lado}" height="{lado}" fill="#fff"/><path d="{trazo}" fill="#000"/></svg>'
+    ).encode('utf-8')
+
+
+def _renderizar(payload, formato, box_size, border, error_correction):
+    if formato == 'matriz':
+        return matriz_qr(payload, error_correction, border)
+    # Las imágenes reutilizan la matriz cacheada del mismo payload
+    matriz = render_qr(payload, 'matriz', border=border, error_correction=error_correction)
+    if formato == 'svg':
+        return svg_qr(matriz, box_size)
+    png = png_qr(matriz, box_size)
+    if formato == 'png':
+        return png
+    return f"data:image/png;base64,{base64.b64encode(png).decode('ascii')}"
+
+
+def render_qr(payload, formato='matriz', box_size=10, border=4, error_correction=qrcode.constants.ERROR_CORRECT_M):
+    """
+    QR de `payload` en `formato` (FORMATOS_QR): 'matriz' (para dibujar_qr), 'png' o 'svg' (bytes)
+    o 'data_uri' (PNG en base64 para un <img>). Se cachea por (payload, formato, box_size, border,
+    nivel de corrección); box_size solo aplica a las imágenes.
+    """
+    if formato not in FORMATOS_QR:
+        raise ValueError(f"Formato de QR no soportado: '{formato}'. Opciones: {', '.join(FORMATOS_QR)}")
+    if formato == 'matriz':
+        box_size = None
+    clave = (payload, formato, box_size, border, error_correction)
+    return _get_render_cache().get_or_set(
+        clave, lambda: _renderizar(payload, formato, box_size, border, error_correction)
+    )
+
+
+def get_qr_cache_stats():
+    """Aciertos/fallos/descartes del cache de QRs renderizados en este proceso."""
+    return _render_cache.stats() if _render_cache is not None else {}